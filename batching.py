@@ -0,0 +1,123 @@
+"""
+Adaptive batch sizing.
+
+BatchSizer watches every finished batch (tokens per row, truncation, valid
+row yield, duplicates, latency) and hill-climbs the batch size toward the
+one that accepts the most rows per second and per token, while staying
+under the size at which responses hit the provider's output token limit.
+"""
+
+import threading
+
+from engine import CHARS_PER_TOKEN
+
+
+def ewma(old, new, alpha=0.3):
+    return new if old is None else (1 - alpha) * old + alpha * new
+
+
+class BatchSizer:
+    """Pick the next batch size from the results of earlier batches.
+
+    Sizes are explored in multiplicative steps of `step`. Each size bucket
+    keeps a moving score of accepted rows/sec times accepted rows/token; the
+    controller keeps moving in the same direction while the score improves
+    and turns around when it drops. A response truncated at the output token
+    limit lowers the ceiling to what actually fit, and clean responses let it
+    creep back up.
+    """
+
+    def __init__(self, start_size=100, min_size=5, max_size=1000, max_output_tokens=None,
+                 step=1.25, headroom=0.85):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.size = min(max(start_size, self.min_size), self.max_size)
+        self.max_output_tokens = max_output_tokens
+        self.step = step
+        self.headroom = headroom  # Fraction of max_output_tokens to aim for
+        self.direction = 1
+        self.ceiling = self.max_size
+        self.tokens_per_row = None    # Response tokens per returned row
+        self.truncation_rate = None
+        self.yield_rate = None        # Accepted rows / requested rows
+        self.duplicate_rate = None
+        self.scores = {}              # Size bucket -> moving score
+        self.last_score = None
+        self.batches = 0
+        self.lock = threading.Lock()
+
+    def _bucket(self, size):
+        return round(size, -1) if size >= 20 else size
+
+    def token_limit(self):
+        """Largest batch whose response should fit in max_output_tokens"""
+        if not self.max_output_tokens or not self.tokens_per_row:
+            return self.max_size
+        return max(self.min_size, int(self.max_output_tokens * self.headroom / self.tokens_per_row))
+
+    def hit_token_limit(self, batch):
+        """Whether a truncated response ran into max_output_tokens.
+
+        Other truncations (dropped connections, the model stopping early) are
+        left to the score, since a smaller batch would not have avoided them.
+        """
+        if not self.max_output_tokens:
+            return False
+        return batch.chars / CHARS_PER_TOKEN >= 0.9 * self.max_output_tokens
+
+    def next_size(self):
+        """Batch size to request next"""
+        with self.lock:
+            return max(self.min_size, min(self.size, self.ceiling, self.token_limit(), self.max_size))
+
+    def record(self, batch):
+        """Update the model with a finished batch"""
+        if (batch.error and not batch.chars) or batch.stopped or batch.aborted:
+            return  # Failed, or cut short by the engine: says nothing about the size
+        rows = batch.received + batch.invalid
+        with self.lock:
+            self.batches += 1
+            self.truncation_rate = ewma(self.truncation_rate, 1.0 if batch.truncated else 0.0)
+            self.yield_rate = ewma(self.yield_rate, batch.added / batch.size)
+            if rows:
+                self.tokens_per_row = ewma(self.tokens_per_row, batch.chars / CHARS_PER_TOKEN / rows)
+                self.duplicate_rate = ewma(self.duplicate_rate, batch.duplicates / rows)
+
+            tokens = (len(batch.prompt) + batch.chars) / CHARS_PER_TOKEN
+            if batch.truncated and self.hit_token_limit(batch):
+                # Shrink the ceiling to what fit, minus a margin
+                self.ceiling = max(self.min_size, int(min(self.ceiling, rows) * 0.9))
+                self.direction = -1
+            elif batch.size >= self.ceiling:
+                self.ceiling = min(self.max_size, max(self.ceiling + 1, int(self.ceiling * 1.05)))
+
+            # Time queued for the rate limiter says nothing about the size, and
+            # a replayed response says nothing about the API's speed
+            latency = batch.request_time
+            if tokens <= 0 or latency <= 0 or batch.replayed:
+                return
+            score = (batch.added / latency) * (batch.added / tokens)
+            bucket = self._bucket(batch.size)
+            self.scores[bucket] = ewma(self.scores.get(bucket), score)
+
+            # Hill climb on the size that was just measured
+            if self.last_score is not None and self.scores[bucket] < self.last_score:
+                self.direction = -self.direction
+            self.last_score = self.scores[bucket]
+            if self.direction > 0:
+                size = max(batch.size + 1, round(batch.size * self.step))
+            else:
+                size = round(batch.size / self.step)
+            self.size = max(self.min_size, min(self.max_size, self.ceiling, size))
+
+    def summary(self):
+        """Current model, for progress displays"""
+        with self.lock:
+            return {
+                "size": self.size,
+                "ceiling": self.ceiling,
+                "tokens_per_row": self.tokens_per_row,
+                "truncation_rate": self.truncation_rate,
+                "yield": self.yield_rate,
+                "duplicate_rate": self.duplicate_rate,
+            }
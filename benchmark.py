@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Offline throughput benchmark for the generation pipeline.
+
+Drives the shared GenerationEngine with the mock provider, either through
+the CLI pipeline (append-only checkpoint) or through the web app (Flask
+/generate with a simulated browser tab polling /progress and /csv_live),
+and reports where the time goes. No API key or network access is needed.
+
+Examples:
+  python3 benchmark.py
+  python3 benchmark.py --sizes 1000 100000 --concurrency 4 --duplicates 0.1
+  python3 benchmark.py --target web --sizes 10000 --latency 0.2 --tokens-per-sec 2000
+  python3 benchmark.py --sizes 10000 --concurrency 8 --rate-limited 0.2 --rpm 600
+  python3 benchmark.py --sizes 10000 --near-duplicates 0.1 --near-dup 0.8
+  python3 benchmark.py --sizes 20000 --adaptive-batch --max-output-tokens 8000 --latency 0.3
+  python3 benchmark.py --sizes 10000 --latency 0.3 --cache /tmp/bench.db   # run twice: replayed
+  python3 benchmark.py --imports        # startup cost of the modules and SDKs
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from batching import BatchSizer
+from cache import CachedProvider, ResponseCache
+from engine import GenerationEngine, STAGES
+from neardup import NearDuplicateFilter
+from gemini_cli import CheckpointWriter
+from providers import MockProvider
+from ratelimit import RateLimiter
+
+COLUMNS = ["Original", "Paraphrased"]
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (label, code) timed in a fresh interpreter by --imports
+IMPORT_TARGETS = (
+    ("gemini_cli", "import gemini_cli"),
+    ("webapp", "import webapp"),
+    ("openai SDK", "import openai"),
+    ("gemini SDK", "import google.generativeai"),
+    ("OpenAI client", "from providers import OpenAIProvider; OpenAIProvider('key').client"),
+    ("Gemini model", "from providers import GeminiProvider; GeminiProvider('key').model()"),
+)
+
+
+def make_provider(args):
+    provider = MockProvider(
+        seed=args.seed,
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        malformed_rate=args.malformed,
+        truncate_rate=args.truncate,
+        duplicate_rate=args.duplicates,
+        near_duplicate_rate=args.near_duplicates,
+        rate_limit_rate=args.rate_limited,
+        max_output_tokens=args.max_output_tokens,
+        cell_words=args.cell_words,
+    )
+    if args.response_cache is not None:
+        return CachedProvider(provider, args.response_cache, seed=args.seed)
+    return provider
+
+
+def make_rate_limiter(args):
+    # Short backoff so simulated 429s do not dominate the wall time
+    return RateLimiter(args.rpm, args.tpm, max_concurrency=args.concurrency, base_delay=0.1, max_delay=2.0)
+
+
+def make_batch_sizer(args, provider):
+    if not args.adaptive_batch:
+        return None
+    return BatchSizer(args.batch, max_size=args.max_batch, max_output_tokens=provider.max_output_tokens)
+
+
+def run_cli(args, total_rows, workdir):
+    """CLI pipeline: engine + append-only checkpoint committed every 100 rows"""
+    checkpoint_file = os.path.join(workdir, f"bench_{total_rows}.csv.checkpoint")
+    checkpoint = CheckpointWriter(checkpoint_file, COLUMNS)
+    checkpoint_time = 0.0
+    last_checkpoint = 0
+
+    def on_batch_end(batch):
+        nonlocal checkpoint_time, last_checkpoint
+        if engine.generated - last_checkpoint >= 100:
+            start = time.perf_counter()
+            with engine.lock:
+                checkpoint.commit(seen=len(engine.seen), api_calls=engine.api_calls)
+            checkpoint_time += time.perf_counter() - start
+            last_checkpoint = engine.generated
+
+    provider = make_provider(args)
+    engine = GenerationEngine(
+        provider, "Benchmark dataset", COLUMNS, total_rows,
+        batch_size=args.batch, concurrency=args.concurrency, rate_limiter=make_rate_limiter(args),
+        batch_sizer=make_batch_sizer(args, provider),
+        stages=[NearDuplicateFilter(args.near_dup)] if args.near_dup else [],
+        on_rows=checkpoint.append, on_batch_end=on_batch_end,
+    )
+    start = time.perf_counter()
+    engine.run()
+    close_start = time.perf_counter()
+    checkpoint.close(seen=len(engine.seen), api_calls=engine.api_calls)
+    checkpoint_time += time.perf_counter() - close_start
+    elapsed = time.perf_counter() - start
+    return engine, elapsed, {"checkpoint": checkpoint_time}
+
+
+def run_web(args, total_rows, workdir):
+    """Web pipeline: Flask /generate with a tab polling every --poll seconds"""
+    from webapp import create_app
+
+    app = create_app(make_provider(args), max_batch_size=args.max_batch if args.adaptive_batch else args.batch,
+                     concurrency=args.concurrency, rate_limiter=make_rate_limiter(args),
+                     adaptive_batch=args.adaptive_batch, near_dup_threshold=args.near_dup)
+    manager = app.config["JOB_MANAGER"]
+    client = app.test_client()
+    polls = 0
+    poll_time = 0.0
+
+    start = time.perf_counter()
+    client.post("/generate", json={
+        "description": "Benchmark dataset", "columns": COLUMNS,
+        "total_rows": total_rows, "batch_size": args.batch,
+    })
+    since = 0
+    while True:
+        poll_start = time.perf_counter()
+        progress = client.get("/progress").get_json()
+        response = client.get(f"/csv_live?since={since}")
+        since = int(response.headers.get("X-Total-Rows", since))
+        poll_time += time.perf_counter() - poll_start
+        polls += 1
+        if not progress["running"]:
+            break
+        time.sleep(args.poll)
+    elapsed = time.perf_counter() - start
+    return manager.current.engine, elapsed, {"polls": polls, "poll": poll_time}
+
+
+def measure_imports(repeat=3):
+    """Time imports and first client setup, each in a fresh interpreter"""
+    print(f"Import / startup times (best of {repeat}, fresh interpreter each):")
+    for label, code in IMPORT_TARGETS:
+        script = f"import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+        times = []
+        for _ in range(repeat):
+            result = subprocess.run([sys.executable, "-c", script], cwd=HERE, capture_output=True, text=True)
+            if result.returncode:
+                break
+            times.append(float(result.stdout.split()[-1]))
+        if times:
+            print(f"  {label:<15}: {min(times) * 1000:7.0f} ms")
+        else:
+            print(f"  {label:<15}: unavailable ({result.stderr.strip().splitlines()[-1]})")
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(HERE, "gemini_cli.py"), "--help"], capture_output=True)
+        times.append(time.perf_counter() - start)
+    print(f"  {'cli --help':<15}: {min(times) * 1000:7.0f} ms (whole process)")
+
+
+def report(total_rows, engine, elapsed, extra):
+    rate = engine.generated / elapsed if elapsed > 0 else 0
+    print(f"\n== {total_rows} rows ==")
+    print(f"  rows generated : {engine.generated}")
+    print(f"  wall time      : {elapsed:.2f} s")
+    print(f"  throughput     : {rate:,.0f} rows/sec")
+    print(f"  batches        : {engine.api_calls + engine.replayed}  (replayed {engine.replayed}, duplicates {engine.duplicates}, invalid {engine.invalid}, "
+          f"rate-limit retries {engine.retries})")
+    if engine.rejected:
+        print(f"  near-duplicates: {engine.rejected.get(NearDuplicateFilter.name, 0)} rejected")
+    for stage in STAGES:
+        seconds = engine.times[stage]
+        share = seconds / elapsed * 100 if elapsed > 0 else 0
+        print(f"  {stage + ' time':<15}: {seconds:.3f} s ({share:.1f}%)")
+    if engine.batch_sizer:
+        model = engine.batch_sizer.summary()
+        print(f"  batch size     : {model['size']} (ceiling {model['ceiling']}, "
+              f"~{model['tokens_per_row'] or 0:.0f} tokens/row, truncated {model['truncation_rate'] or 0:.0%})")
+    cache = getattr(engine.provider, "cache", None)
+    if cache is not None:
+        print(f"  response cache : {cache.hits} replayed, {cache.misses} fetched (all runs so far)")
+    if "checkpoint" in extra:
+        print(f"  checkpoint time: {extra['checkpoint']:.3f} s")
+    if "poll" in extra:
+        print(f"  polling        : {extra['polls']} polls, {extra['poll']:.3f} s")
+    # ru_maxrss is KiB on Linux
+    print(f"  peak RSS       : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Offline throughput benchmark (mock provider)',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="Examples:" + __doc__.split("Examples:")[1],
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000],
+                        help='Dataset sizes to run (default: 1000 100000 1000000)')
+    parser.add_argument('--target', choices=['cli', 'web'], default='cli', help='Pipeline to drive (default: cli)')
+    parser.add_argument('-b', '--batch', type=int, default=100, help='Batch size (default: 100)')
+    parser.add_argument('--adaptive-batch', action='store_true', help='Let the batch size adapt (starts at -b)')
+    parser.add_argument('--max-batch', type=int, default=1000, help='Largest adaptive batch size (default: 1000)')
+    parser.add_argument('-j', '--concurrency', type=int, default=1, help='Batches in flight (default: 1)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mock seconds before first chunk')
+    parser.add_argument('--tokens-per-sec', type=float, default=0, help='Mock streaming speed (0 = unlimited)')
+    parser.add_argument('--malformed', type=float, default=0.0, help='Mock malformed object rate')
+    parser.add_argument('--truncate', type=float, default=0.0, help='Mock truncated response rate')
+    parser.add_argument('--duplicates', type=float, default=0.0, help='Mock duplicate row rate')
+    parser.add_argument('--near-duplicates', type=float, default=0.0, help='Mock near-duplicate row rate')
+    parser.add_argument('--near-dup', type=float, default=None, help='Near-duplicate similarity threshold (default: off)')
+    parser.add_argument('--rate-limited', type=float, default=0.0, help='Mock simulated 429 rate')
+    parser.add_argument('--rpm', type=int, default=0, help='Requests per minute budget (default: unlimited)')
+    parser.add_argument('--tpm', type=int, default=0, help='Tokens per minute budget (default: unlimited)')
+    parser.add_argument('--max-output-tokens', type=int, default=0, help='Mock response token limit (0 = none)')
+    parser.add_argument('--cell-words', type=int, default=8, help='Mock words per cell (default: 8)')
+    parser.add_argument('--poll', type=float, default=0.3, help='Web target poll interval (default: 0.3)')
+    parser.add_argument('--seed', type=int, default=0, help='Mock random seed')
+    parser.add_argument('--cache', help='Response cache file; a second run replays from it')
+    parser.add_argument('--imports', action='store_true', help='Only measure import and startup times')
+    args = parser.parse_args()
+    if args.imports:
+        measure_imports()
+        return
+    args.response_cache = ResponseCache(args.cache) if args.cache else None
+
+    run = run_web if args.target == 'web' else run_cli
+    print(f"Benchmark target: {args.target}, batch {args.batch}, concurrency {args.concurrency}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for total_rows in args.sizes:
+            engine, elapsed, extra = run(args, total_rows, workdir)
+            report(total_rows, engine, elapsed, extra)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
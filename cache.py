@@ -0,0 +1,176 @@
+"""
+On-disk cache of raw LLM responses.
+
+ResponseCache stores each complete response under a digest of (model,
+prompt, seed, batch index) in a SQLite file and evicts the least recently
+used entries once the file holds more than `max_bytes` of responses.
+CachedProvider wraps any provider with it, so a rerun of the same dataset
+(to re-validate, re-export or benchmark it) replays the responses through
+the normal parse/validate/dedup pipeline without spending any quota.
+
+Every batch of the same size sends the same prompt, so the batch index is
+the prompt's occurrence number within the run: the nth request with a given
+prompt replays the nth cached response for it. Change the seed to get fresh
+responses for the same prompts.
+"""
+
+import hashlib
+import heapq
+import sqlite3
+import threading
+import time
+import zlib
+
+from providers import Provider
+
+
+def cache_key(model, prompt, seed, index):
+    """Digest identifying one response"""
+    h = hashlib.blake2b(digest_size=16)
+    for part in (model, prompt, str(seed), str(index)):
+        data = part.encode('utf-8')
+        h.update(len(data).to_bytes(4, 'little'))
+        h.update(data)
+    return h.digest()
+
+
+class ResponseCache:
+    """SQLite table of zlib-compressed responses with LRU eviction"""
+
+    def __init__(self, path, max_bytes=1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()  # Shared by engine worker threads
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                        "key BLOB PRIMARY KEY, body BLOB NOT NULL, "
+                        "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Cached response text for `key`, or None"""
+        with self.lock:
+            found = self.db.execute("SELECT body FROM responses WHERE key = ?", (key,)).fetchone()
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.db.commit()
+        return zlib.decompress(found[0]).decode('utf-8')
+
+    def put(self, key, text):
+        """Store a complete response, evicting old ones to stay under max_bytes"""
+        body = zlib.compress(text.encode('utf-8'))
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old:
+                self.total_bytes -= old[0]
+            self.db.execute("INSERT OR REPLACE INTO responses (key, body, size, last_used) VALUES (?, ?, ?, ?)",
+                            (key, body, len(body), time.time()))
+            self.total_bytes += len(body)
+            while self.total_bytes > self.max_bytes:
+                oldest = self.db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 64").fetchall()
+                if not oldest:
+                    break
+                for old_key, size in oldest:
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                    self.total_bytes -= size
+                    self.evicted += 1
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+class CachedProvider(Provider):
+    """Provider that replays responses from a ResponseCache.
+
+    Hits are returned by replay(), before the engine takes any rate-limit
+    budget. Misses are streamed from `provider` one chunk behind, so a
+    response is stored as soon as its last chunk is known even if the
+    engine stops reading right after it. Failed or abandoned responses are
+    not stored and their batch index is handed to the next request.
+    """
+
+    def __init__(self, provider, cache, seed=0):
+        super().__init__(provider.model_name)
+        self.provider = provider
+        self.cache = cache
+        self.seed = seed
+        self.name = provider.name
+        self.label = provider.label
+        self.max_output_tokens = provider.max_output_tokens
+        self.model = f"{provider.name}:{provider.model_name}"
+        self.indexes = {}  # prompt -> [next unused index, heap of released indexes]
+        self.lock = threading.Lock()
+        self.local = threading.local()  # A missed lookup, kept for this thread's stream()
+
+    def _claim(self, prompt):
+        with self.lock:
+            state = self.indexes.setdefault(prompt, [0, []])
+            if state[1]:
+                return heapq.heappop(state[1])
+            state[0] += 1
+            return state[0] - 1
+
+    def _release(self, prompt, index):
+        with self.lock:
+            heapq.heappush(self.indexes[prompt][1], index)
+
+    def _lookup(self, prompt):
+        index = self._claim(prompt)
+        key = cache_key(self.model, prompt, self.seed, index)
+        return index, key, self.cache.get(key)
+
+    def replay(self, prompt, columns, batch_size):
+        pending = getattr(self.local, "pending", None)
+        if pending:
+            # The last miss never reached stream() (e.g. the engine stopped)
+            self._release(pending[0], pending[1])
+        index, key, text = self._lookup(prompt)
+        self.local.pending = None if text is not None else (prompt, index, key)
+        return text
+
+    def stream(self, prompt, columns, batch_size):
+        pending = getattr(self.local, "pending", None)
+        self.local.pending = None
+        if pending and pending[0] == prompt:
+            _, index, key = pending
+        else:
+            if pending:
+                self._release(pending[0], pending[1])
+            index, key, text = self._lookup(prompt)
+            if text is not None:
+                yield text
+                return
+        chunks = []
+        stored = False
+        try:
+            inner = iter(self.provider.stream(prompt, columns, batch_size))
+            chunk = next(inner, None)
+            while chunk is not None:
+                following = next(inner, None)
+                chunks.append(chunk)
+                if following is None:
+                    self.cache.put(key, "".join(chunks))
+                    stored = True
+                yield chunk
+                chunk = following
+        finally:
+            if not stored:
+                self._release(prompt, index)
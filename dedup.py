@@ -0,0 +1,165 @@
+"""
+Compact exact-duplicate indexes.
+
+Rows are identified by a 128-bit blake2b digest instead of being kept as
+tuples of strings, so dedup costs a few dozen bytes per row no matter how
+long the cells are.
+
+  DigestSet           in-memory open-addressing table of digests (default)
+  SqliteDigestIndex   digests in a SQLite file with a Bloom filter in front,
+                      so the index survives restarts and barely uses RAM
+
+Both offer add(row) -> True if the row is new, len(), commit() and close().
+"""
+
+import hashlib
+import math
+import sqlite3
+
+DIGEST_SIZE = 16
+EMPTY = bytes(DIGEST_SIZE)
+
+
+def row_digest(row):
+    """128-bit digest of a row (cells are length-prefixed, so no separator can collide)"""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    for cell in row:
+        data = cell.encode('utf-8')
+        h.update(len(data).to_bytes(4, 'little'))
+        h.update(data)
+    digest = h.digest()
+    # The all-zero digest marks empty slots in DigestSet
+    return digest if digest != EMPTY else b'\x01' + digest[1:]
+
+
+class DigestSet:
+    """Open-addressing hash set of row digests in one bytearray.
+
+    Linear probing at a load factor of at most 1/2 keeps lookups short. The
+    table doubles once it is half full, so it uses 32 to 64 bytes per row.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = 1 << max(4, math.ceil(math.log2(max(capacity, 1) * 2)))
+        self.table = bytearray(self.capacity * DIGEST_SIZE)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, digest):
+        """Byte offset of `digest`, or of the empty slot where it belongs"""
+        mask = self.capacity - 1
+        slot = int.from_bytes(digest[:8], 'little') & mask
+        table = self.table
+        while True:
+            start = slot * DIGEST_SIZE
+            current = table[start:start + DIGEST_SIZE]
+            if current == digest or current == EMPTY:
+                return start
+            slot = (slot + 1) & mask
+
+    def _grow(self):
+        old = self.table
+        self.capacity *= 2
+        self.table = bytearray(self.capacity * DIGEST_SIZE)
+        for start in range(0, len(old), DIGEST_SIZE):
+            digest = bytes(old[start:start + DIGEST_SIZE])
+            if digest != EMPTY:
+                new_start = self._slot(digest)
+                self.table[new_start:new_start + DIGEST_SIZE] = digest
+
+    def add_digest(self, digest):
+        """Insert a digest; return True if it was not there yet"""
+        start = self._slot(digest)
+        if self.table[start:start + DIGEST_SIZE] == digest:
+            return False
+        self.table[start:start + DIGEST_SIZE] = digest
+        self.count += 1
+        if self.count * 2 > self.capacity:
+            self._grow()
+        return True
+
+    def add(self, row):
+        return self.add_digest(row_digest(row))
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class BloomFilter:
+    """Bloom filter over row digests (the digest bits serve as the hashes)"""
+
+    def __init__(self, expected_items, error_rate=0.01):
+        expected_items = max(expected_items, 1000)
+        self.bits = int(-expected_items * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / expected_items * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: h1 + i * h2
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def add(self, digest):
+        for pos in self._positions(digest):
+            self.array[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        return all(self.array[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class SqliteDigestIndex:
+    """Row digests stored in a SQLite file, with a Bloom filter in front.
+
+    New rows (the common case) are recognized by the Bloom filter without a
+    database read; only possible duplicates are looked up. Inserts are
+    only committed by commit()/close(), so the caller can commit them
+    together with the rows they belong to (e.g. at each checkpoint) and a
+    crash never leaves digests of rows that were not saved.
+    """
+
+    def __init__(self, path, expected_rows=1000000, error_rate=0.01):
+        self.path = path
+        self.expected_rows = expected_rows
+        self.error_rate = error_rate
+        # Called from engine worker threads, always under the engine lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS digests (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.count = self.db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        self.bloom = BloomFilter(max(expected_rows, self.count * 2), error_rate)
+        for (digest,) in self.db.execute("SELECT digest FROM digests"):
+            self.bloom.add(digest)
+
+    def __len__(self):
+        return self.count
+
+    def add(self, row):
+        digest = row_digest(row)
+        if digest in self.bloom:
+            if self.db.execute("SELECT 1 FROM digests WHERE digest = ?", (digest,)).fetchone():
+                return False
+        self.db.execute("INSERT INTO digests (digest) VALUES (?)", (digest,))
+        self.bloom.add(digest)
+        self.count += 1
+        return True
+
+    def clear(self):
+        """Forget every digest (for a fresh run reusing the file)"""
+        self.db.execute("DELETE FROM digests")
+        self.db.commit()
+        self.bloom = BloomFilter(self.expected_rows, self.error_rate)
+        self.count = 0
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
@@ -0,0 +1,436 @@
+"""
+Shared generation engine for the web apps and the CLI.
+
+GenerationEngine runs the batch loop: it keeps up to `concurrency` batch
+requests in flight, parses each streamed response incrementally, validates
+and deduplicates rows as they arrive, and stops after too many empty
+batches in a row. Requests go through a RateLimiter, so rate-limited calls
+are retried with backoff (a batch counts as empty only once its retries run
+out), and an optional BatchSizer picks each batch size from earlier results.
+Extra row stages (e.g. neardup.NearDuplicateFilter) run after the exact
+dedup check.
+Frontends plug in through callbacks for display and storage.
+"""
+
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from dedup import DigestSet
+from json_stream import JsonArrayParser, rows_from_items
+from pool import FairPool
+from ratelimit import RateLimiter, pause, rate_limit_info
+
+# Per-batch timing stages: parsing, row validation, dedup (exact and extra
+# stages), on_rows (storage), and waiting to acquire the merge lock
+STAGES = ("parse", "validate", "dedup", "store", "lock_wait")
+
+# Cell values that are obviously placeholder text
+PLACEHOLDER_VALUES = {'value1', 'value2', 'example', 'n/a', 'null', 'none'}
+
+# Rough characters per token, for estimating token usage before a request
+CHARS_PER_TOKEN = 4
+
+# Seconds between checks for stop()/drain deadlines while batches are in flight
+DRAIN_POLL = 0.5
+
+# Limits past which a response is abandoned instead of read to the end
+MAX_PREAMBLE_CHARS = 4000   # Text before the JSON array starts
+MIN_OBJECT_CHARS = 8000     # A single row object may always grow this large...
+OBJECT_SIZE_FACTOR = 20     # ...or this many times the usual row size
+MIN_PARSE_ERRORS = 5        # Malformed objects before "mostly malformed" applies
+MIN_REPEAT_ROWS = 20        # Rows before "repeating itself" applies
+MAX_REPEAT_RATE = 0.9       # Share of duplicate rows that counts as a loop
+
+
+def validate_row_quality(row, columns):
+    """Validate that row meets quality standards"""
+    if not row or len(row) != len(columns):
+        return False
+    for cell in row:
+        # Check if cell is empty
+        if not cell or len(cell.strip()) == 0:
+            return False
+        # Check if cell looks like obvious placeholder text
+        if cell.lower() in PLACEHOLDER_VALUES:
+            return False
+    return True
+
+
+def build_prompt(description, columns, batch_size, steering=""):
+    """Build the batch request prompt (`steering`: extra per-batch instructions)"""
+    second = columns[1] if len(columns) > 1 else columns[0]
+    if steering:
+        steering = f"\n{steering}\n"
+    return f"""Task: {description}
+
+Generate EXACTLY {batch_size} entries following the description EXACTLY.
+{steering}
+Output format: Valid JSON array of objects with these exact keys: {', '.join(columns)}
+
+CRITICAL: Output ONLY the JSON array, nothing else. Ensure the JSON is complete and valid.
+
+Example:
+[
+  {{"{columns[0]}": "content here", "{second}": "content here"}},
+  {{"{columns[0]}": "different content", "{second}": "different content"}}
+]
+
+Generate {batch_size} unique, diverse entries now."""
+
+
+class Batch:
+    """One batch request and what came of it"""
+
+    def __init__(self, number, size, prompt):
+        self.number = number
+        self.size = size            # Rows requested
+        self.prompt = prompt
+        self.received = 0           # Rows that passed validation
+        self.added = 0              # Rows accepted into the dataset
+        self.duplicates = 0
+        self.invalid = 0
+        self.rejected = {}          # Stage name -> rows rejected by that stage
+        self.parse_errors = 0       # Objects that were not valid JSON
+        self.chars = 0              # Response size
+        self.truncated = False
+        self.stopped = False        # Stopped reading once enough rows arrived
+        self.skipped = False        # Never sent: the engine stopped while it waited for budget
+        self.replayed = False       # Served by provider.replay() without an API call
+        self.aborted = None         # Why the response was abandoned early (runaway or garbage)
+        self.is_json = False        # Response contained a JSON array
+        self.error = None           # Exception raised by the provider
+        self.rate_limited = False   # The error was a 429 / quota error
+        self.retries = 0            # Requests retried after a rate limit
+        self.estimated_tokens = 0   # Token budget reserved for the request
+        self.started = None
+        self.requested = None       # When the last attempt was sent (after rate limiting)
+        self.first_chunk = None     # When the first response text arrived
+        self.finished = None
+        self.sample = None          # Last accepted row
+        self.variant = None         # Prompt variant, when a PromptScheduler is used
+        self.times = dict.fromkeys(STAGES, 0.0)  # Seconds spent per stage
+
+    @property
+    def request_time(self):
+        """Seconds since the last attempt was sent, without rate-limit waits and backoff"""
+        if self.requested is None:
+            return 0.0
+        return (self.finished or time.time()) - self.requested
+
+
+class GenerationEngine:
+    """Batch loop shared by the web apps and the CLI.
+
+    Callbacks (all optional):
+      on_batch_start(batch)      - request about to be sent, after rate limiting (worker thread)
+      on_chunk(batch, text)      - response text received (worker thread)
+      on_retry(batch, delay)     - rate limited, retrying after `delay` seconds (worker thread)
+      on_rows(rows)              - rows accepted, called with `lock` held
+      on_batch_end(batch)        - batch finished (calling thread)
+
+    With `metrics` (a metrics.Metrics), every finished batch is recorded there.
+    """
+
+    def __init__(self, provider, description, columns, total_rows, batch_size=100,
+                 max_batch_size=None, overfetch=0, concurrency=1, max_empty_batches=3,
+                 seen=None, stages=(), generated=0, lock=None, rate_limiter=None,
+                 batch_sizer=None, prompt_scheduler=None, metrics=None, executor=None, on_batch_start=None,
+                 on_chunk=None, on_retry=None, on_rows=None, on_batch_end=None):
+        self.provider = provider
+        self.description = description
+        self.columns = columns
+        self.total_rows = total_rows
+        self.batch_size = batch_size
+        self.max_batch_size = max_batch_size or batch_size
+        self.overfetch = overfetch  # Request this many times the rows still needed
+        self.concurrency = max(1, int(concurrency))
+        self.max_empty_batches = max_empty_batches
+        self.seen = seen if seen is not None else DigestSet()  # Dedup index, see dedup.py
+        self.stages = list(stages)  # Objects with name and admit(row) -> bool
+        self.generated = generated
+        self.lock = lock or threading.Lock()
+        # Shared limiter (e.g. across web jobs) or one just for this run
+        self.rate_limiter = rate_limiter or RateLimiter(max_concurrency=self.concurrency)
+        self.batch_sizer = batch_sizer  # Replaces the fixed batch_size when set
+        self.prompt_scheduler = prompt_scheduler  # Varies the prompt per batch, see prompts.py
+        self.metrics = metrics
+        self.executor = executor  # Where batches run (a pool.FairPool handle); default: own pool
+        self.on_batch_start = on_batch_start
+        self.on_chunk = on_chunk
+        self.on_retry = on_retry
+        self.on_rows = on_rows
+        self.on_batch_end = on_batch_end
+
+        self.api_calls = 0
+        self.replayed = 0           # Batches served by provider.replay(), not counted as API calls
+        self.empty_batches = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.rejected = {}
+        self.times = dict.fromkeys(STAGES, 0.0)  # Totals over finished batches
+        self.tokens_per_row = 50.0  # Running estimate of response tokens per row
+        self.retries = 0            # Rate-limited requests that were retried
+        self.aborted_batches = 0    # Responses abandoned early, see _runaway()
+        self.stopping = False
+        self.stop_reason = None
+        self.stop_event = threading.Event()
+        self.closed = False
+        self.dispatched = 0
+        self.drain_deadline = None  # Set by stop(drain_timeout=...)
+        self.abandoned = 0          # In-flight batches given up (drain timeout or interrupt)
+        self.in_flight = 0          # Batches dispatched and not yet handled
+
+    def next_batch_size(self, remaining):
+        """Rows to request when `remaining` rows are still unclaimed"""
+        if self.batch_sizer:
+            size = self.batch_sizer.next_size()
+            limit = int(self.overfetch * remaining) if self.overfetch else remaining
+            return max(1, min(size, limit))
+        if self.overfetch:
+            size = max(self.batch_size, int(self.overfetch * remaining))
+        else:
+            size = min(self.batch_size, remaining)
+        return max(1, min(size, self.max_batch_size))
+
+    def stop(self, reason, drain_timeout=None):
+        """Stop dispatching new batches; in-flight batches still finish.
+
+        With `drain_timeout`, run() gives in-flight batches that many seconds
+        to finish and merge, then abandons the rest and returns. Safe to call
+        from other threads and from signal handlers.
+        """
+        if not self.stopping:
+            self.stopping = True
+            self.stop_reason = reason
+            self.stop_event.set()  # Wakes rate-limit waits and retry backoffs
+        if drain_timeout is not None:
+            deadline = time.monotonic() + max(0, drain_timeout)
+            if self.drain_deadline is None or deadline < self.drain_deadline:
+                self.drain_deadline = deadline
+
+    def run(self):
+        """Generate until total_rows is reached or generation stops"""
+        # Batches in flight: future -> (batch, rows reserved toward total_rows)
+        in_flight = {}
+        executor = self.executor or FairPool(self.concurrency).executor(None, owned=True)
+        try:
+            while True:
+                # Top up the in-flight window without over-claiming past total_rows
+                reserved = sum(claim for _, claim in in_flight.values())
+                # The limiter lowers the window after 429s and raises it again
+                window = min(self.concurrency, self.rate_limiter.concurrency_limit)
+                while (not self.stopping and len(in_flight) < window
+                       and self.generated + reserved < self.total_rows):
+                    remaining = self.total_rows - self.generated - reserved
+                    size = self.next_batch_size(remaining)
+                    self.dispatched += 1
+                    if self.prompt_scheduler:
+                        variant, prompt = self.prompt_scheduler.next_prompt(size)
+                    else:
+                        variant, prompt = None, build_prompt(self.description, self.columns, size)
+                    batch = Batch(self.dispatched, size, prompt)
+                    batch.variant = variant
+                    future = executor.submit(self._run_batch, batch)
+                    claim = min(size, remaining)
+                    in_flight[future] = (batch, claim)
+                    reserved += claim
+                self.in_flight = len(in_flight)
+
+                if not in_flight:
+                    break
+
+                # Wake up now and then so a stop() from another thread or a
+                # signal handler is noticed while batches are still streaming
+                timeout = DRAIN_POLL
+                if self.drain_deadline is not None:
+                    timeout = min(timeout, max(0, self.drain_deadline - time.monotonic()))
+                done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+                if (not done and self.drain_deadline is not None
+                        and time.monotonic() >= self.drain_deadline):
+                    break
+
+                # Handle results in completion order
+                for future in done:
+                    batch, _ = in_flight.pop(future)
+                    self.in_flight = len(in_flight)
+                    if batch.skipped:
+                        continue
+                    if batch.replayed:
+                        self.replayed += 1
+                    else:
+                        self.api_calls += 1
+                    for stage, seconds in batch.times.items():
+                        self.times[stage] += seconds
+                    self.retries += batch.retries
+                    if batch.aborted:
+                        self.aborted_batches += 1
+                    if self.batch_sizer:
+                        self.batch_sizer.record(batch)
+                    if self.prompt_scheduler:
+                        self.prompt_scheduler.record(batch)
+                    if self.metrics:
+                        self.metrics.observe_batch(batch)
+                    if batch.received:
+                        tokens = batch.chars / CHARS_PER_TOKEN / batch.received
+                        self.tokens_per_row = 0.8 * self.tokens_per_row + 0.2 * tokens
+                    if batch.received:
+                        self.empty_batches = 0
+                    else:
+                        self.empty_batches += 1
+                        if self.empty_batches >= self.max_empty_batches:
+                            self.stop("Too many empty batches")
+                    if self.on_batch_end:
+                        self.on_batch_end(batch)
+        finally:
+            with self.lock:
+                # Late results from abandoned batches must not reach on_rows
+                self.closed = True
+            self.abandoned = len(in_flight)
+            # Abandoned requests run on daemon threads, so they never keep
+            # the process alive after the caller has saved its output
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.generated
+
+    def _run_batch(self, batch):
+        """Request one batch, retrying rate-limited requests with backoff"""
+        batch.started = time.time()
+        limiter = self.rate_limiter
+        batch.estimated_tokens = int(len(batch.prompt) / CHARS_PER_TOKEN + batch.size * self.tokens_per_row)
+        # A replayed response (e.g. from the response cache) costs no quota
+        replay = self.provider.replay(batch.prompt, self.columns, batch.size)
+        batch.replayed = replay is not None
+        if not batch.replayed and not limiter.acquire(batch.estimated_tokens, self.stop_event):
+            batch.skipped = True  # Stopped while waiting for budget; nothing was sent
+            batch.finished = time.time()
+            return batch
+        if self.on_batch_start:
+            try:
+                self.on_batch_start(batch)
+            except Exception as e:
+                batch.error = e
+                batch.finished = time.time()
+                return batch
+        while True:
+            batch.requested = time.time()
+            parser = JsonArrayParser()
+            batch.error = None
+            try:
+                self._stream_batch(batch, parser, replay)
+            except Exception as e:
+                batch.error = e
+            if batch.replayed:
+                break
+            limiter.record_tokens(batch.estimated_tokens, (len(batch.prompt) + parser.chars) / CHARS_PER_TOKEN)
+            limited, retry_after = rate_limit_info(batch.error) if batch.error else (False, None)
+            batch.rate_limited = limited
+            if not limited or self.stopping or self.closed:
+                break
+            # Each 429 is recorded once, whether or not the batch is retried
+            delay = limiter.on_rate_limited(batch.retries, retry_after)
+            # Only retry when nothing arrived yet, so no row is merged twice
+            if not parser.chars and batch.retries < limiter.max_retries:
+                batch.retries += 1
+                if self.on_retry:
+                    self.on_retry(batch, delay)
+                # stop() cuts the backoff short; the batch then ends with the 429
+                if pause(delay, self.stop_event) or not limiter.acquire(batch.estimated_tokens, self.stop_event):
+                    break
+                continue
+            break
+        # A replay says nothing about the API's rate limits
+        if not batch.error and not batch.replayed:
+            limiter.on_success()
+        batch.chars = parser.chars
+        batch.is_json = parser.started
+        batch.truncated = parser.truncated and not batch.stopped and not batch.aborted
+        batch.parse_errors = parser.errors
+        batch.finished = time.time()
+        return batch
+
+    def _stream_batch(self, batch, parser, replay=None):
+        """Send one request (or feed the `replay` text) and merge its rows as they stream in"""
+        chunks = [replay] if replay is not None else self.provider.stream(batch.prompt, self.columns, batch.size)
+        for text in chunks:
+            if batch.first_chunk is None:
+                batch.first_chunk = time.time()
+            if self.on_chunk:
+                self.on_chunk(batch, text)
+            parse_start = time.perf_counter()
+            items = parser.feed(text)
+            batch.times["parse"] += time.perf_counter() - parse_start
+            if items:
+                self._merge(batch, rows_from_items(items, self.columns))
+            if self.generated >= self.total_rows or self.closed:
+                batch.stopped = True
+                break
+            # Leaving the loop closes the provider's stream, which ends the request
+            batch.aborted = self._runaway(batch, parser)
+            if batch.aborted:
+                break
+
+    def _runaway(self, batch, parser):
+        """Reason to stop reading a response that has gone wrong, or None.
+
+        Every complete row is merged as it arrives, so abandoning a response
+        loses nothing already received; it only stops paying for output that
+        will not become rows.
+        """
+        if not parser.started:
+            if parser.chars > MAX_PREAMBLE_CHARS:
+                return "no JSON array in the response"
+            return None
+        limit = max(MIN_OBJECT_CHARS, OBJECT_SIZE_FACTOR * self.tokens_per_row * CHARS_PER_TOKEN)
+        if parser.open_chars > limit:
+            return f"one object grew past {int(limit)} characters"
+        if parser.errors >= MIN_PARSE_ERRORS and parser.errors > parser.objects:
+            return "mostly malformed JSON"
+        if parser.objects > 2 * batch.size + 10:
+            return f"{parser.objects} objects for {batch.size} requested rows"
+        rows = batch.received + batch.invalid
+        if rows >= MIN_REPEAT_ROWS and batch.duplicates >= MAX_REPEAT_RATE * rows:
+            return "model is repeating itself"
+        return None
+
+    def _merge(self, batch, rows):
+        """Validate, dedup and accept rows"""
+        # Validation needs no shared state, so it runs before taking the lock
+        validate_start = time.perf_counter()
+        valid = [row for row in rows if validate_row_quality(row, self.columns)]
+        invalid = len(rows) - len(valid)
+        wait_start = time.perf_counter()
+        batch.times["validate"] += wait_start - validate_start
+        with self.lock:
+            dedup_start = time.perf_counter()
+            batch.times["lock_wait"] += dedup_start - wait_start
+            if self.closed:
+                return
+            to_add = []
+            duplicates = 0
+            for row in valid:
+                if not self.seen.add(row):
+                    duplicates += 1
+                    continue
+                rejected_by = next((stage.name for stage in self.stages if not stage.admit(row)), None)
+                if rejected_by:
+                    batch.rejected[rejected_by] = batch.rejected.get(rejected_by, 0) + 1
+                    self.rejected[rejected_by] = self.rejected.get(rejected_by, 0) + 1
+                    continue
+                to_add.append(row)
+            to_add = to_add[:self.total_rows - self.generated]
+            batch.received += len(valid)
+            batch.invalid += invalid
+            batch.duplicates += duplicates
+            self.invalid += invalid
+            self.duplicates += duplicates
+            store_start = time.perf_counter()
+            batch.times["dedup"] += store_start - dedup_start
+            if to_add:
+                self.generated += len(to_add)
+                batch.added += len(to_add)
+                batch.sample = to_add[-1]
+                if self.prompt_scheduler:
+                    self.prompt_scheduler.remember(to_add)
+                if self.on_rows:
+                    self.on_rows(to_add)
+                    batch.times["store"] += time.perf_counter() - store_start
@@ -0,0 +1,82 @@
+"""
+Streaming dataset writers shared by the web apps and the CLI.
+
+Every function here yields text chunks instead of building the whole file in
+memory, so exporting a dataset costs the same peak memory at 1k rows as at
+millions of rows.
+"""
+
+import csv
+import io
+import json
+import os
+
+# Rows serialized per yielded chunk
+CHUNK_ROWS = 500
+
+
+def iter_csv(columns, rows, header=True):
+    """Yield a CSV document in chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CHUNK_ROWS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_json(columns, rows):
+    """Yield a pretty-printed JSON array of row objects in chunks"""
+    yield "["
+    first = True
+    for row in rows:
+        # Only rows with the correct column count are exported
+        if len(row) != len(columns):
+            continue
+        item = json.dumps(dict(zip(columns, row)), indent=2, ensure_ascii=False)
+        yield ("\n  " if first else ",\n  ") + item.replace("\n", "\n  ")
+        first = False
+    yield "]" if first else "\n]"
+
+
+def iter_jsonl(columns, rows):
+    """Yield one JSON object per line"""
+    for row in rows:
+        if len(row) != len(columns):
+            continue
+        yield json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n"
+
+
+def write_chunks(filename, chunks):
+    """Write streamed chunks to a file.
+
+    The chunks go to a temporary file that replaces `filename` at the end,
+    so a file the chunks are read from is never truncated while it is read.
+    """
+    temp = f"{filename}.tmp"
+    try:
+        with open(temp, 'w', newline='', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp, filename)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def read_csv_rows(filename):
+    """Yield the data rows of a CSV file, skipping its header"""
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            yield row
@@ -10,21 +10,21 @@ import json
 import time
 import sys
 import argparse
+import shutil
+import signal
 from dotenv import load_dotenv
-import google.generativeai as genai
 from datetime import datetime
-
-# Load environment
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash")
-
-if not GEMINI_API_KEY or GEMINI_API_KEY == "your_api_key_here":
-    print("ERROR: GEMINI_API_KEY is not set in .env file")
-    exit(1)
-
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
+from batching import BatchSizer
+from cache import CachedProvider, ResponseCache
+from dedup import DigestSet, SqliteDigestIndex
+from neardup import NearDuplicateFilter
+from prompts import PromptScheduler
+from engine import CHARS_PER_TOKEN, STAGES, GenerationEngine, build_prompt
+from exporters import iter_json, iter_jsonl, read_csv_rows, write_chunks
+from metrics import Metrics
+from tracelog import TraceWriter, main as report_main
+from providers import create_provider
+from ratelimit import RateLimiter
 
 # Colors for terminal output
 class Colors:
@@ -54,82 +54,146 @@ def print_info(text):
 def print_warning(text):
     print(f"{Colors.YELLOW}⚠ {text}{Colors.ENDC}")
 
-def validate_row_quality(row, columns):
-    """Validate row quality"""
-    if not row or len(row) != len(columns):
-        return False
-    for cell in row:
-        if not cell or len(cell.strip()) == 0:
-            return False
-        if cell.lower() in ['value1', 'value2', 'example', 'n/a', 'null', 'none']:
-            return False
-    return True
+class CheckpointWriter:
+    """Append-only CSV checkpoint with a small JSON sidecar for counters.
+
+    Only new rows are written on each append, so the cost of a checkpoint
+    does not grow with the dataset. The sidecar records how many rows and
+    bytes of the checkpoint are known to be complete.
+    """
+
+    def __init__(self, filename, columns, resume_rows=None):
+        self.filename = filename
+        self.meta_file = f"{filename}.meta"
+        self.columns = columns
+        if resume_rows is None:
+            self.rows = 0
+            self.file = open(filename, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(columns)
+        else:
+            # Continue an existing checkpoint already trimmed by load_checkpoint()
+            self.rows = resume_rows
+            self.file = open(filename, 'a', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+
+    def append(self, rows):
+        """Append new rows to the checkpoint (buffered until commit)"""
+        self.writer.writerows(rows)
+        self.rows += len(rows)
 
-def generate_batch(description, columns, batch_size):
-    """Generate a batch of data using Gemini"""
-    model = genai.GenerativeModel(
-        model_name=MODEL_NAME,
-        generation_config={
-            "temperature": 1,
-            "max_output_tokens": 32000,
-            "response_mime_type": "application/json",
+    def commit(self, **counters):
+        """Flush and fsync appended rows, then update the sidecar"""
+        self.file.flush()
+        # The sidecar must never point past data a power loss could take back
+        os.fsync(self.file.fileno())
+        meta = {
+            "columns": self.columns,
+            "rows": self.rows,
+            "offset": self.file.tell(),
+            "updated": datetime.now().isoformat(timespec='seconds'),
         }
-    )
-    
-    prompt = f"""Task: {description}
+        meta.update(counters)
+        tmp_file = f"{self.meta_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_file, self.meta_file)
 
-Generate EXACTLY {batch_size} entries following the description EXACTLY.
+    def close(self, **counters):
+        """Commit and close the checkpoint"""
+        self.commit(**counters)
+        self.file.close()
 
-Output a JSON array of objects with these exact keys: {', '.join(columns)}
+def read_checkpoint_meta(filename):
+    """Return the checkpoint's sidecar counters ({} if there is none)"""
+    meta_file = f"{filename}.meta"
+    if not os.path.exists(meta_file):
+        return {}
+    with open(meta_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _ends_line(filename, offset, size):
+    """True if `offset` is within the file and right after a newline"""
+    if not 0 < offset <= size:
+        return False
+    with open(filename, 'rb') as f:
+        f.seek(offset - 1)
+        return f.read(1) == b'\n'
 
-Example format:
-[
-  {{"{columns[0]}": "content here", "{columns[1]}": "content here"}},
-  {{"{columns[0]}": "different content", "{columns[1]}": "different content"}}
-]
+def load_checkpoint(filename, columns, seen, stages=()):
+    """Stream an existing checkpoint into `seen` (if given) and the row stages,
+    dropping any torn tail.
 
-Generate {batch_size} unique, diverse entries now."""
+    Returns (row_count, sidecar_meta, last_row).
+    """
+    meta = read_checkpoint_meta(filename)
     
-    try:
-        print(f"{Colors.CYAN}  → Calling Gemini API...{Colors.ENDC}", end='', flush=True)
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        print(f"\r{Colors.GREEN}  ✓ Received response ({len(response_text)} chars){Colors.ENDC}")
-        
-        # Parse JSON
-        data = json.loads(response_text)
-        if isinstance(data, dict) and "data" in data:
-            data = data["data"]
-        
-        if not isinstance(data, list):
-            print_error("Response is not a JSON array")
-            return []
-        
-        # Convert to rows
-        rows = []
-        for item in data:
-            if isinstance(item, dict):
-                row = [str(item.get(col, "")).strip() for col in columns]
-                if validate_row_quality(row, columns):
-                    rows.append(row)
-        
-        return rows
-        
-    except json.JSONDecodeError as e:
-        print_error(f"Failed to parse JSON: {e}")
-        return []
-    except Exception as e:
-        print_error(f"API call failed: {e}")
-        return []
+    # Trim anything written after the last committed offset (or, without a
+    # usable sidecar offset, after the last complete line) so appends start
+    # on a clean row
+    size = os.path.getsize(filename)
+    offset = meta.get("offset")
+    if offset is not None and not _ends_line(filename, offset, size):
+        offset = None  # Sidecar from a newer state than the data on disk
+    if offset is None:
+        with open(filename, 'rb') as f:
+            f.seek(max(0, size - 65536))
+            tail = f.read()
+        offset = size - len(tail) + tail.rfind(b'\n') + 1
+    if offset < size:
+        with open(filename, 'r+b') as f:
+            f.truncate(offset)
+    
+    count = 0
+    last_row = None
+    with open(filename, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header != columns:
+            raise ValueError(f"Checkpoint columns {header} do not match {columns}")
+        for row in reader:
+            if seen is not None:
+                seen.add(row)
+            for stage in stages:
+                stage.add(row)
+            last_row = row
+            count += 1
+    return count, meta, last_row
+
+def config_problems(description, columns, total_rows, batch_size, output_file, concurrency, near_dup,
+                    metrics_file=None, trace_file=None, topics=None, attributes=None):
+    """List what is wrong with a run configuration (empty if it is usable)"""
+    problems = []
+    if not description or not str(description).strip():
+        problems.append("Description is empty")
+    if not columns or not all(isinstance(col, str) and col.strip() for col in columns):
+        problems.append("Columns must be a non-empty list of names")
+    elif len(set(columns)) != len(columns):
+        problems.append("Column names must be unique")
+    for name, value in (("Rows", total_rows), ("Batch size", batch_size), ("Concurrency", concurrency)):
+        if not isinstance(value, int) or value < 1:
+            problems.append(f"{name} must be a positive integer, got {value!r}")
+    if near_dup is not None and not 0 < near_dup <= 1:
+        problems.append(f"Near-duplicate threshold must be between 0 and 1, got {near_dup}")
+    if topics is not None and (not isinstance(topics, list)
+                               or not all(isinstance(topic, str) and topic.strip() for topic in topics)):
+        problems.append(f"Topics must be a list of strings, got {topics!r}")
+    if attributes is not None and (not isinstance(attributes, dict) or not all(
+            isinstance(values, list) and values for values in attributes.values())):
+        problems.append(f"Attributes must map each name to a non-empty list of values, got {attributes!r}")
+    for path in filter(None, (output_file, metrics_file, trace_file)):
+        output_dir = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(output_dir) or not os.access(output_dir, os.W_OK):
+            problems.append(f"Cannot write to {output_dir}")
+    return problems
 
-def save_checkpoint(filename, columns, rows):
-    """Save current progress to CSV"""
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.writer(f)
-        writer.writerow(columns)
-        writer.writerows(rows)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "report":
+        # Offline subcommand: needs no API key or config
+        report_main(sys.argv[2:])
+        return
+    load_dotenv()
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         description='Gemini Dataset Generator - CLI Mode',
@@ -144,6 +208,46 @@ Examples:
   
   # With config file
   python3 gemini_cli.py --config config.json
+  
+  # Keep 4 batch requests in flight at once
+  python3 gemini_cli.py --config config.json -j 4
+  
+  # Continue an interrupted run
+  python3 gemini_cli.py --config config.json --resume
+  
+  # Let the batch size adapt to truncation and yield (between 5 and 500 rows)
+  python3 gemini_cli.py --config config.json --adaptive-batch --max-batch 500
+  
+  # Keep the dedup index on disk (little RAM, survives restarts)
+  python3 gemini_cli.py --config config.json --dedup-index dataset.dedup.db
+  
+  # Also reject rows that are 85% similar to an earlier row
+  python3 gemini_cli.py --config config.json --near-dup 0.85
+  
+  # Stay under a quota of 60 requests / 1M tokens per minute
+  python3 gemini_cli.py --config config.json -j 8 --rpm 60 --tpm 1000000
+  
+  # Vary the prompt per batch (topics, negative examples) to cut duplicates
+  python3 gemini_cli.py --config config.json --diversity --topics "sports,science,travel"
+  
+  # Check a config (and the API key) without calling the API
+  python3 gemini_cli.py --config config.json --dry-run
+  
+  # Cache responses; rerunning the same config replays them without API calls
+  python3 gemini_cli.py --config config.json --cache responses.db
+  
+  # Same prompts, fresh responses (the seed is part of the cache key)
+  python3 gemini_cli.py --config config.json --cache responses.db --seed 2
+  
+  # On Ctrl+C / SIGTERM, wait up to 60s for in-flight batches before saving
+  python3 gemini_cli.py --config config.json -j 8 --drain-timeout 60
+  
+  # Export latency histograms and row counters for Prometheus (node_exporter textfile)
+  python3 gemini_cli.py --config config.json --metrics-file /var/lib/node_exporter/datagen.prom
+  
+  # Log every batch, then summarize (or compare) runs: tail latencies, throughput, yield
+  python3 gemini_cli.py --config config.json --trace run.jsonl
+  python3 gemini_cli.py report run.jsonl other_run.jsonl
         """
     )
     
@@ -151,11 +255,56 @@ Examples:
     parser.add_argument('-c', '--columns', help='Comma-separated column names')
     parser.add_argument('-n', '--rows', type=int, help='Total rows to generate')
     parser.add_argument('-b', '--batch', type=int, default=100, help='Batch size (default: 100)')
+    parser.add_argument('--adaptive-batch', action='store_true',
+                        help='Tune the batch size from truncation, yield and speed (starts at -b)')
+    parser.add_argument('--max-batch', type=int, default=1000, help='Largest adaptive batch size (default: 1000)')
     parser.add_argument('-o', '--output', default='dataset.csv', help='Output filename (default: dataset.csv)')
+    parser.add_argument('-j', '--concurrency', type=int, default=1, help='Batch requests kept in flight at once (default: 1)')
+    parser.add_argument('-p', '--provider', default='gemini', choices=['gemini', 'openai', 'mock'],
+                        help='LLM provider (default: gemini; mock needs no API key)')
+    parser.add_argument('--rpm', type=int, default=0, help='Requests per minute budget (default: 0 = unlimited)')
+    parser.add_argument('--tpm', type=int, default=0, help='Tokens per minute budget (default: 0 = unlimited)')
+    parser.add_argument('--dedup-index', help='SQLite file for the dedup index (default: in memory)')
+    parser.add_argument('--near-dup', type=float, metavar='THRESHOLD',
+                        help='Reject rows at least this similar (0-1) to an earlier row (default: off)')
+    parser.add_argument('--diversity', action='store_true',
+                        help='Vary the prompt per batch and favour the variants with the best yield')
+    parser.add_argument('--topics', help='Comma-separated topics for --diversity (default: generic angles)')
+    parser.add_argument('--negatives', type=int, default=5,
+                        help='Accepted rows quoted per prompt as examples not to repeat (default: 5)')
+    parser.add_argument('--cache', help='SQLite file caching raw responses for reruns (default: off)')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Response cache size limit in MB (default: 1024)')
+    parser.add_argument('--seed', type=int, default=0, help='Cache seed; change it to skip cached responses (default: 0)')
+    parser.add_argument('--drain-timeout', type=float, default=30,
+                        help='Seconds to wait for in-flight batches after Ctrl+C or SIGTERM (default: 30)')
+    parser.add_argument('--trace', help='Write one JSON record per batch to this file (see "report" below)')
+    parser.add_argument('--metrics-file', help='Write Prometheus metrics to this file at every checkpoint (default: off)')
     parser.add_argument('--config', help='JSON config file with all parameters')
+    parser.add_argument('--dry-run', '--validate-config', dest='dry_run', action='store_true',
+                        help='Check the configuration and exit without loading the SDK or calling the API')
     parser.add_argument('-y', '--yes', action='store_true', help='Skip confirmation prompt')
+    parser.add_argument('--jsonl', action='store_true', help='Also save a .jsonl file (one JSON object per line)')
+    parser.add_argument('--resume', action='store_true', help='Continue from <output>.checkpoint if it exists')
     
     args = parser.parse_args()
+    concurrency = args.concurrency
+    provider_name = args.provider
+    requests_per_min = args.rpm
+    adaptive_batch = args.adaptive_batch
+    max_batch = args.max_batch
+    dedup_index = args.dedup_index
+    near_dup = args.near_dup
+    tokens_per_min = args.tpm
+    drain_timeout = args.drain_timeout
+    cache_file = args.cache
+    cache_size = args.cache_size
+    seed = args.seed
+    diversity = args.diversity
+    topics = [topic.strip() for topic in args.topics.split(',') if topic.strip()] if args.topics else None
+    attributes = None
+    negatives = args.negatives
+    metrics_file = args.metrics_file
+    trace_file = args.trace
     
     print_header("Gemini Dataset Generator - CLI Mode")
     
@@ -169,6 +318,24 @@ Examples:
             total_rows = config.get('rows')
             batch_size = config.get('batch_size', 100)
             output_file = config.get('output', 'dataset.csv')
+            concurrency = config.get('concurrency', concurrency)
+            provider_name = config.get('provider', provider_name)
+            requests_per_min = config.get('requests_per_min', requests_per_min)
+            tokens_per_min = config.get('tokens_per_min', tokens_per_min)
+            adaptive_batch = config.get('adaptive_batch', adaptive_batch)
+            max_batch = config.get('max_batch_size', max_batch)
+            dedup_index = config.get('dedup_index', dedup_index)
+            near_dup = config.get('near_duplicate_threshold', near_dup)
+            drain_timeout = config.get('drain_timeout', drain_timeout)
+            cache_file = config.get('cache', cache_file)
+            cache_size = config.get('cache_size_mb', cache_size)
+            seed = config.get('seed', seed)
+            diversity = config.get('diversity', diversity)
+            topics = config.get('topics', topics)
+            attributes = config.get('attributes', attributes)
+            negatives = config.get('negatives', negatives)
+            metrics_file = config.get('metrics_file', metrics_file)
+            trace_file = config.get('trace', trace_file)
             print_success(f"Loaded configuration from {args.config}")
         except Exception as e:
             print_error(f"Failed to load config file: {e}")
@@ -190,9 +357,41 @@ Examples:
         batch_size = int(input(f"{Colors.CYAN}Batch size (default 100): {Colors.ENDC}") or "100")
         output_file = input(f"{Colors.CYAN}Output filename (default: dataset.csv): {Colors.ENDC}") or "dataset.csv"
     
-    print_info(f"Model: {MODEL_NAME}")
+    problems = config_problems(description, columns, total_rows, batch_size, output_file, concurrency, near_dup,
+                               metrics_file, trace_file, topics, attributes)
+    try:
+        # Cheap: the SDK is only loaded when the first request is sent
+        provider = create_provider(provider_name, max_connections=max(1, int(concurrency)))
+    except Exception as e:
+        problems.append(str(e))
+    if problems:
+        for problem in problems:
+            print_error(f"ERROR: {problem}")
+        sys.exit(1)
+    
+    print_info(f"Model: {provider.model_name} ({provider.name})")
     print_info(f"Output: {output_file}")
     print_info(f"Columns: {', '.join(columns)}")
+    concurrency = max(1, int(concurrency))
+    if concurrency > 1:
+        print_info(f"Concurrency: {concurrency} batches in flight")
+    if adaptive_batch:
+        print_info(f"Adaptive batch size: {batch_size} to start, at most {max_batch}")
+    if diversity:
+        print_info(f"Prompt diversity: {len(topics) if topics else 'default'} topics"
+                   + (f", attributes {', '.join(attributes)}" if attributes else "")
+                   + f", {negatives} negative examples")
+    if requests_per_min or tokens_per_min:
+        print_info(f"Rate limit: {requests_per_min or 'unlimited'} requests/min, {tokens_per_min or 'unlimited'} tokens/min")
+    
+    if args.dry_run:
+        # Rough budget: the engine starts out assuming ~50 response tokens per row
+        batches = -(-total_rows // batch_size)
+        prompt_tokens = len(build_prompt(description, columns, batch_size)) / CHARS_PER_TOKEN
+        print_info(f"Estimate: {batches} requests, ~{batches * prompt_tokens + total_rows * 50:,.0f} tokens "
+                   f"(before duplicates and retries)")
+        print_success("Configuration is valid (dry run, nothing was generated)")
+        return
     
     # Confirm (skip if -y flag)
     if not args.yes:
@@ -207,106 +406,253 @@ Examples:
     # Start generation
     print_header("Starting Generation")
     start_time = time.time()
-    generated_data = []
-    seen = set()
-    api_calls = 0
-    empty_batches = 0
-    max_empty_batches = 3
+    generated = 0
+    if dedup_index:
+        seen = SqliteDigestIndex(dedup_index, expected_rows=total_rows)
+        if not args.resume:
+            seen.clear()
+        print_info(f"Dedup index: {dedup_index} ({len(seen)} rows)")
+    else:
+        seen = DigestSet(total_rows)
+    stages = []
+    if near_dup:
+        stages.append(NearDuplicateFilter(near_dup))
+        print_info(f"Near-duplicate filter: similarity >= {near_dup}")
+    cache = None
+    if cache_file:
+        cache = ResponseCache(cache_file, max_bytes=cache_size * 1024 * 1024)
+        provider = CachedProvider(provider, cache, seed=seed)
+        print_info(f"Response cache: {cache_file} ({len(cache)} responses, seed {seed})")
+    earlier_calls = 0
     
     checkpoint_interval = 100  # Save every 100 rows
-    last_checkpoint = 0
+    checkpoint_file = f"{output_file}.checkpoint"
+    resume_rows = None
+    if args.resume:
+        if os.path.exists(checkpoint_file):
+            try:
+                # A persistent index already holds the checkpoint's rows if it
+                # was committed with it; otherwise (e.g. after a crash between
+                # the two commits) rebuild it from the checkpoint
+                index_loaded = False
+                if dedup_index and len(seen) > 0:
+                    recorded = read_checkpoint_meta(checkpoint_file).get("seen")
+                    index_loaded = len(seen) == recorded
+                    if not index_loaded:
+                        print_warning(f"Dedup index holds {len(seen)} rows, the checkpoint recorded {recorded}; "
+                                      f"rebuilding it from the checkpoint")
+                        seen.clear()
+                resume_rows, meta, last_row = load_checkpoint(checkpoint_file, columns, None if index_loaded else seen, stages)
+            except Exception as e:
+                print_error(f"Failed to load checkpoint: {e}")
+                return
+            generated = resume_rows
+            earlier_calls = meta.get("api_calls", 0)
+            print_success(f"Resumed {resume_rows} rows from {checkpoint_file} ({earlier_calls} earlier API calls)")
+        else:
+            print_warning(f"No checkpoint found at {checkpoint_file}, starting fresh")
+            if dedup_index:
+                seen.clear()
+    checkpoint = CheckpointWriter(checkpoint_file, columns, resume_rows=resume_rows)
+    resumed = generated
+    last_checkpoint = generated
+    
+    def on_batch_start(batch):
+        variant = f" ({prompt_scheduler.describe(batch.variant)})" if prompt_scheduler else ""
+        print(f"\n{Colors.BOLD}Batch {batch.number}:{Colors.ENDC} Requesting {batch.size} rows{variant}...")
     
-    while len(generated_data) < total_rows:
-        current_batch = min(batch_size, total_rows - len(generated_data))
+    def on_retry(batch, delay):
+        print_warning(f"Batch {batch.number}: rate limited, retrying in {delay:.1f}s "
+                      f"(concurrency now {rate_limiter.concurrency_limit})")
+    
+    def show_batch(batch):
+        api_calls = earlier_calls + engine.api_calls
+        if batch.rate_limited:
+            print_error(f"Batch {batch.number}: still rate limited after {batch.retries} retries: {batch.error}")
+        elif batch.error:
+            print_error(f"Batch {batch.number}: API call failed: {batch.error}")
+        else:
+            print(f"{Colors.GREEN}  ✓ Batch {batch.number}: received response ({batch.chars} chars){Colors.ENDC}")
+            if batch.aborted:
+                print_warning(f"Response abandoned early ({batch.aborted}), kept {batch.received} rows")
+            elif not batch.is_json:
+                print_error("Response is not a JSON array")
+            elif batch.truncated:
+                print_warning(f"Response truncated, kept {batch.received} complete rows")
+            if batch.parse_errors:
+                print_warning(f"Skipped {batch.parse_errors} malformed objects")
         
-        print(f"\n{Colors.BOLD}Batch {api_calls + 1}:{Colors.ENDC} Requesting {current_batch} rows...")
+        if not batch.received:
+            print_warning(f"Batch {batch.number}: empty batch ({engine.empty_batches}/{engine.max_empty_batches})")
+            if engine.stop_reason:
+                print_error(f"{engine.stop_reason}. Stopping.")
+            return
         
-        try:
-            rows = generate_batch(description, columns, current_batch)
-            api_calls += 1
-            
-            if not rows:
-                empty_batches += 1
-                print_warning(f"Empty batch ({empty_batches}/{max_empty_batches})")
-                if empty_batches >= max_empty_batches:
-                    print_error("Too many empty batches. Stopping.")
-                    break
-                continue
-            
-            empty_batches = 0
-            
-            # Deduplicate
-            new_rows = []
-            for row in rows:
-                trow = tuple(row)
-                if trow not in seen:
-                    seen.add(trow)
-                    new_rows.append(row)
-            
-            # Add to dataset
-            needed = total_rows - len(generated_data)
-            to_add = new_rows[:needed]
-            generated_data.extend(to_add)
-            
-            # Progress
-            progress = len(generated_data)
-            percent = (progress / total_rows) * 100
-            elapsed = time.time() - start_time
-            rate = progress / elapsed if elapsed > 0 else 0
-            eta = (total_rows - progress) / rate if rate > 0 else 0
-            
-            print_success(f"Added {len(to_add)} rows (duplicates filtered: {len(rows) - len(new_rows)})")
-            print(f"{Colors.BOLD}Progress:{Colors.ENDC} {progress}/{total_rows} ({percent:.1f}%)")
-            print(f"{Colors.BOLD}Rate:{Colors.ENDC} {rate:.1f} rows/sec")
-            print(f"{Colors.BOLD}ETA:{Colors.ENDC} {eta/60:.1f} minutes")
-            print(f"{Colors.BOLD}API Calls:{Colors.ENDC} {api_calls}")
-            
-            # Checkpoint save
-            if progress - last_checkpoint >= checkpoint_interval:
-                checkpoint_file = f"{output_file}.checkpoint"
-                save_checkpoint(checkpoint_file, columns, generated_data)
-                print_info(f"Checkpoint saved: {checkpoint_file}")
-                last_checkpoint = progress
-            
-            # Show sample of latest row
-            if to_add:
-                print(f"\n{Colors.CYAN}Latest row sample:{Colors.ENDC}")
-                for i, col in enumerate(columns):
-                    value = to_add[-1][i][:100] + "..." if len(to_add[-1][i]) > 100 else to_add[-1][i]
-                    print(f"  {col}: {value}")
-            
-        except KeyboardInterrupt:
-            print_warning("\n\nInterrupted by user")
-            break
-        except Exception as e:
-            print_error(f"Unexpected error: {e}")
-            import traceback
-            traceback.print_exc()
+        # Progress
+        progress = engine.generated
+        percent = (progress / total_rows) * 100
+        elapsed = time.time() - start_time
+        rate = (progress - resumed) / elapsed if elapsed > 0 else 0
+        eta = (total_rows - progress) / rate if rate > 0 else 0
+        
+        filtered = f"duplicates filtered: {batch.duplicates}"
+        if near_dup:
+            filtered += f", near-duplicates: {batch.rejected.get(NearDuplicateFilter.name, 0)}"
+        print_success(f"Batch {batch.number}: added {batch.added} rows ({filtered})")
+        print(f"{Colors.BOLD}Progress:{Colors.ENDC} {progress}/{total_rows} ({percent:.1f}%)")
+        print(f"{Colors.BOLD}Rate:{Colors.ENDC} {rate:.1f} rows/sec")
+        print(f"{Colors.BOLD}ETA:{Colors.ENDC} {eta/60:.1f} minutes")
+        print(f"{Colors.BOLD}API Calls:{Colors.ENDC} {api_calls}")
+        if batch_sizer:
+            model = batch_sizer.summary()
+            print(f"{Colors.BOLD}Next batch:{Colors.ENDC} {batch_sizer.next_size()} rows "
+                  f"(~{model['tokens_per_row'] or 0:.0f} tokens/row, truncated {model['truncation_rate'] or 0:.0%}, "
+                  f"yield {model['yield'] or 0:.0%}, duplicates {model['duplicate_rate'] or 0:.0%})")
+        
+        # Show sample of latest row
+        if batch.sample:
+            print(f"\n{Colors.CYAN}Latest row sample:{Colors.ENDC}")
+            for i, col in enumerate(columns):
+                value = batch.sample[i][:100] + "..." if len(batch.sample[i]) > 100 else batch.sample[i]
+                print(f"  {col}: {value}")
+    
+    def save_checkpoint():
+        """Commit the checkpoint every checkpoint_interval rows; return the seconds it took"""
+        nonlocal last_checkpoint
+        progress = engine.generated
+        if progress - last_checkpoint < checkpoint_interval:
+            return 0.0
+        save_start = time.perf_counter()
+        with engine.lock:
+            checkpoint.commit(seen=len(seen), api_calls=earlier_calls + engine.api_calls)
+            seen.commit()
+        seconds = time.perf_counter() - save_start
+        if metrics is not None:
+            metrics.write_textfile(metrics_file)
+        print_info(f"Checkpoint saved: {checkpoint_file}")
+        last_checkpoint = progress
+        return seconds
+    
+    def on_batch_end(batch):
+        show_batch(batch)
+        checkpoint_seconds = save_checkpoint()
+        if trace is not None:
+            trace.batch(batch, engine.generated, checkpoint_seconds)
+    
+    # Rows go straight to the checkpoint as they are accepted
+    rate_limiter = RateLimiter(requests_per_min, tokens_per_min, max_concurrency=concurrency)
+    batch_sizer = None
+    if adaptive_batch:
+        batch_sizer = BatchSizer(batch_size, max_size=max_batch, max_output_tokens=provider.max_output_tokens)
+    prompt_scheduler = None
+    if diversity:
+        # Seeded, so a rerun sends the same prompt variants and --cache can replay them
+        prompt_scheduler = PromptScheduler(description, columns, topics=topics, attributes=attributes,
+                                           negatives=negatives, seed=seed)
+    metrics = None
+    if metrics_file:
+        metrics = Metrics()
+        metrics.gauge("rows_generated", "Rows in the dataset so far", lambda: engine.generated)
+        metrics.gauge("rows_target", "Rows requested for the dataset", lambda: total_rows)
+        print_info(f"Metrics file: {metrics_file}")
+    trace = None
+    if trace_file:
+        # A resumed run is appended to its trace as a new run
+        trace = TraceWriter(trace_file, append=args.resume)
+        trace.run(provider=provider.name, model=provider.model_name, description=description, columns=columns,
+                  total_rows=total_rows, batch_size=batch_size, concurrency=concurrency,
+                  adaptive_batch=bool(adaptive_batch), diversity=bool(diversity), near_dup=near_dup,
+                  cache=bool(cache_file), resumed=generated)
+        print_info(f"Trace: {trace_file}")
+    engine = GenerationEngine(
+        provider, description, columns, total_rows,
+        batch_size=batch_size, concurrency=concurrency, seen=seen, stages=stages, generated=generated,
+        rate_limiter=rate_limiter, batch_sizer=batch_sizer, prompt_scheduler=prompt_scheduler,
+        metrics=metrics, on_batch_start=on_batch_start, on_retry=on_retry,
+        on_rows=checkpoint.append, on_batch_end=on_batch_end,
+    )
     
-    # Final save
+    # First Ctrl+C / SIGTERM: stop dispatching and let in-flight batches
+    # (already paid for) finish and merge. A second one stops right away.
+    interrupted = False
+    
+    def on_signal(signum, frame):
+        nonlocal interrupted
+        if interrupted:
+            raise KeyboardInterrupt
+        interrupted = True
+        in_flight = engine.in_flight
+        print_warning(f"\n\n{signal.Signals(signum).name} received: no new batches, waiting up to "
+                      f"{drain_timeout:.0f}s for {in_flight} in-flight batch(es). Press Ctrl+C again to stop now.")
+        engine.stop("Interrupted", drain_timeout=drain_timeout)
+    
+    previous_handlers = {signum: signal.signal(signum, on_signal) for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        print_warning("\n\nStopped without waiting for in-flight batches")
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+        api_calls = earlier_calls + engine.api_calls
+        generated = engine.generated
+        checkpoint.close(seen=len(seen), api_calls=api_calls)
+        seen.close()
+        if cache is not None:
+            cache.close()
+        if metrics is not None:
+            metrics.write_textfile(metrics_file)
+        if trace is not None:
+            trace.end(generated=generated, api_calls=api_calls, stop_reason=engine.stop_reason,
+                      abandoned=engine.abandoned, times=engine.times)
+            trace.close()
+    if interrupted:
+        abandoned = engine.abandoned  # Never got to on_batch_end
+        print_warning(f"Interrupted: saved {generated} rows to {checkpoint_file}"
+                      + (f", {abandoned} in-flight batch(es) abandoned" if abandoned
+                         else ", all in-flight batches merged"))
+    
+    # Final save (the closed checkpoint already holds every row)
     print_header("Saving Final Dataset")
-    save_checkpoint(output_file, columns, generated_data)
+    shutil.copyfile(checkpoint_file, output_file)
     
     # Summary
     elapsed = time.time() - start_time
-    print_header("Generation Complete")
-    print_success(f"Generated {len(generated_data)} rows")
+    print_header("Generation Stopped" if interrupted else "Generation Complete")
+    print_success(f"Generated {generated} rows")
+    if resumed:
+        print_info(f"Resumed from checkpoint: {resumed} rows")
     print_info(f"API calls: {api_calls}")
+    if near_dup:
+        print_info(f"Near-duplicates rejected: {engine.rejected.get(NearDuplicateFilter.name, 0)}")
+    if engine.retries:
+        print_info(f"Rate-limit retries: {engine.retries}")
+    if engine.aborted_batches:
+        print_info(f"Responses abandoned early (runaway or garbage output): {engine.aborted_batches}")
+    if prompt_scheduler:
+        print_info("Best prompt variants (yield, duplicates, batches):")
+        for name, accepted, duplicate_rate, batches in prompt_scheduler.summary():
+            print(f"    {name}: {accepted:.0%}, {duplicate_rate:.0%}, {batches}")
+    if cache is not None:
+        print_info(f"Response cache: {cache.hits} replayed, {cache.misses} fetched"
+                   + (f", {cache.evicted} evicted" if cache.evicted else ""))
+    print_info("Time per stage: " + ", ".join(f"{stage} {engine.times[stage]:.2f}s" for stage in STAGES))
     print_info(f"Time elapsed: {elapsed/60:.1f} minutes")
-    print_info(f"Average rate: {len(generated_data)/elapsed:.1f} rows/sec")
+    print_info(f"Average rate: {(generated - resumed)/elapsed:.1f} rows/sec")
     print_info(f"Output file: {output_file}")
     
-    # Also save as JSON
-    json_file = output_file.replace('.csv', '.json')
-    json_data = []
-    for row in generated_data:
-        row_dict = {columns[i]: row[i] for i in range(len(columns))}
-        json_data.append(row_dict)
-    
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump(json_data, f, indent=2, ensure_ascii=False)
-    
-    print_success(f"Also saved as JSON: {json_file}")
+    # Also save as JSON, streamed from the CSV so rows are never all in memory
+    exports = [('.json', iter_json, "JSON")]
+    if args.jsonl:
+        exports.append(('.jsonl', iter_jsonl, "JSONL"))
+    base = os.path.splitext(output_file)[0]
+    for extension, exporter, name in exports:
+        export_file = base + extension
+        if os.path.abspath(export_file) == os.path.abspath(output_file):
+            print_warning(f"Not saving {name}: {export_file} is the CSV output itself (use a .csv output name)")
+            continue
+        write_chunks(export_file, exporter(columns, read_csv_rows(output_file)))
+        print_success(f"Also saved as {name}: {export_file}")
 
 if __name__ == "__main__":
     try:
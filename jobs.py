@@ -0,0 +1,376 @@
+"""
+Generation jobs for the web frontend.
+
+JobManager runs any number of dataset jobs side by side. Each Job has its
+own row store, stream buffer and engine; all jobs share one FairPool of
+worker threads, which serves the jobs' batch requests round-robin, and one
+RateLimiter, so together they stay within the API quota. At most
+`max_running` jobs generate at once; later ones wait in a queue.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict, deque, namedtuple
+
+from batching import BatchSizer
+from engine import GenerationEngine
+from neardup import NearDuplicateFilter
+from pool import FairPool
+from prompts import PromptScheduler
+from ratelimit import RateLimiter
+from rowstore import RowStore
+
+
+class StreamBuffer:
+    """Bounded buffer of recent stream records (call with lock held).
+
+    Each record keeps the streamed chunks as a list instead of one growing
+    string, readers fetch only the chunks they have not seen yet, and only
+    the last few finished records are kept. Chunk lists are append-only, so
+    a view() stays valid after the lock is released.
+    """
+
+    def __init__(self, max_finished=3):
+        self.records = OrderedDict()  # stream id -> record
+        self.max_finished = max_finished
+        self.next_id = 0
+
+    def start(self):
+        """Open a new record and return its stream id"""
+        stream_id = self.next_id
+        self.next_id += 1
+        self.records[stream_id] = {"status": "generating", "chunks": [], "chars": 0}
+        return stream_id
+
+    def append(self, stream_id, text):
+        record = self.records[stream_id]
+        record["chunks"].append(text)
+        record["chars"] += len(text)
+
+    def finish(self, stream_id, status="complete"):
+        """Mark a record finished and evict the oldest finished records"""
+        self.records[stream_id]["status"] = status
+        finished = [sid for sid, record in self.records.items() if record["status"] != "generating"]
+        for sid in finished[:-self.max_finished]:
+            del self.records[sid]
+
+    def view(self):
+        """Freeze the current records as (stream id, status, chunks, chunk count)"""
+        return tuple((stream_id, record["status"], record["chunks"], len(record["chunks"]))
+                     for stream_id, record in self.records.items())
+
+
+def stream_latest(view):
+    """Return the newest record of a StreamBuffer view with its full text, for /progress"""
+    if not view:
+        return []
+    stream_id, status, chunks, count = view[-1]
+    return [{"id": stream_id, "status": status, "text": "".join(chunks[:count])}]
+
+
+def stream_deltas(view, sent):
+    """Return (stream id, status, new text) for records of `view` changed since `sent`.
+
+    `sent` maps stream id -> (chunks sent, status sent) and is updated.
+    """
+    changes = []
+    for stream_id, status, chunks, count in view:
+        sent_count, sent_status = sent.get(stream_id, (0, None))
+        if count > sent_count or status != sent_status:
+            changes.append((stream_id, status, "".join(chunks[sent_count:count])))
+            sent[stream_id] = (count, status)
+    live = {record[0] for record in view}
+    for stream_id in [sid for sid in sent if sid not in live]:
+        del sent[stream_id]
+    return changes
+
+
+# Everything a request handler needs, published as one immutable value
+Snapshot = namedtuple("Snapshot", "version job_number columns rows progress streams")
+
+
+class Job:
+    """Dataset, progress and engine of one generation job.
+
+    Writers (the manager and the job's callbacks) change state under `lock`
+    and then publish(), which swaps in a new immutable Snapshot. Readers
+    only use `current`, so polling tabs never block the generator.
+    """
+
+    def __init__(self, job_id, number, label, description="", columns=(), total_rows=0, batch_size=50):
+        self.id = job_id
+        self.number = number  # Sequence number, part of /csv_live ETags
+        self.label = label
+        self.batch_size = batch_size
+        self.rows = RowStore(columns)
+        self.dataset_meta = {
+            "columns": list(columns),
+            "description": description,
+            "total_rows": total_rows,
+        }
+        self.api_call_count = 0
+        self.status = "queued"  # queued, running, cancelling, finished, cancelled or failed (idle: placeholder)
+        self.error = None
+        self.cancelled = False  # Cancel requested while running
+        self.created = time.time()
+        self.finished = None
+        self.stream_buffer = StreamBuffer()
+        self.engine = None
+        self.lock = threading.Lock()  # Serializes writers only
+        self.changed = threading.Condition()  # Wakes /events listeners
+        self.current = None
+        self.publish()
+
+    @property
+    def running(self):
+        return self.status in ("queued", "running", "cancelling")
+
+    def publish(self):
+        """Publish a new snapshot and wake /events listeners (call with lock held)"""
+        rows = self.rows.snapshot()
+        self.current = Snapshot(
+            version=self.current.version + 1 if self.current else 0,
+            job_number=self.number,
+            columns=self.dataset_meta["columns"],
+            rows=rows,
+            progress=self.progress(len(rows)),
+            streams=self.stream_buffer.view(),
+        )
+        with self.changed:
+            self.changed.notify_all()
+
+    def progress(self, count):
+        """Build the progress payload (call with lock held)"""
+        label = self.label
+        total = self.dataset_meta["total_rows"]
+        error = None
+        warning = None
+        running = self.running
+        if self.status == "failed":
+            error = f"Generation failed: {self.error}"
+        elif self.status == "cancelling":
+            warning = f"Cancelling: finishing in-flight batches. Generated {count} out of {total} rows so far."
+        elif total > 0 and count < total and not running:
+            if self.status == "cancelled":
+                warning = f"Generation was cancelled. Generated {count} out of {total} rows. You can still download the partial CSV."
+            elif count == 0:
+                error = f"{label} did not return any valid data. Please check your prompt or try again."
+            else:
+                warning = f"{label} could not generate the full requested dataset. Generated {count} out of {total} rows. You can still download the partial CSV."
+        return {
+            "id": self.id,
+            "status": self.status,
+            "generated": count,
+            "total": total,
+            "columns": self.dataset_meta["columns"],
+            "api_calls": self.api_call_count,
+            "error": error,
+            "warning": warning,
+            "running": running,
+        }
+
+    def summary(self):
+        """Progress plus job metadata, for /jobs"""
+        return dict(self.current.progress, description=self.dataset_meta["description"],
+                    created=self.created, finished=self.finished,
+                    abandoned_batches=self.engine.abandoned if self.engine else 0)
+
+    def wait(self, timeout=None):
+        """Wait until the job is no longer running; return whether it stopped"""
+        with self.changed:
+            return self.changed.wait_for(lambda: not self.running, timeout)
+
+    def snapshot_rows(self):
+        """Return the columns and a snapshot of the rows generated so far"""
+        snapshot = self.current
+        return snapshot.columns, snapshot.rows
+
+
+class JobManager:
+    """Create, run, queue and cancel generation jobs for one provider"""
+
+    def __init__(self, provider, max_batch_size=100, concurrency=1, rate_limiter=None,
+                 adaptive_batch=True, near_dup_threshold=None, max_running=4, max_finished=20,
+                 drain_timeout=30, prompt_diversity=False, metrics=None):
+        self.provider = provider
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency  # Batches in flight per job
+        self.rate_limiter = rate_limiter or RateLimiter(max_concurrency=concurrency)
+        self.adaptive_batch = adaptive_batch
+        self.near_dup_threshold = near_dup_threshold
+        self.prompt_diversity = prompt_diversity  # Vary each job's prompt per batch (prompts.py)
+        self.max_running = max_running
+        self.max_finished = max_finished  # Finished jobs kept for download
+        self.drain_timeout = drain_timeout  # Seconds cancelled jobs wait for in-flight batches
+        self.metrics = metrics  # metrics.Metrics shared by every job's engine
+        self.pool = FairPool(concurrency * max_running)
+        self.jobs = OrderedDict()  # job id -> Job
+        self.pending = deque()     # Jobs waiting for a running slot
+        self.running = 0
+        self.count = 0
+        self.lock = threading.Lock()
+        # The job the single-job UI routes show; an empty placeholder at first
+        self.current = Job("", 0, provider.label)
+        self.current.status = "idle"
+        self.current.publish()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def create(self, description, columns, total_rows, batch_size=50):
+        """Create a job and start it, or queue it if max_running jobs are busy"""
+        with self.lock:
+            self.count += 1
+            job = Job(uuid.uuid4().hex[:8], self.count, self.provider.label,
+                      description, columns, total_rows, batch_size)
+            job.engine = self._build_engine(job)
+            self.jobs[job.id] = job
+            if self.running < self.max_running:
+                self.running += 1
+                self._start(job)
+            else:
+                self.pending.append(job)
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued job, or stop a running one from dispatching more batches.
+
+        A running job keeps merging its in-flight batches for up to
+        drain_timeout seconds (status "cancelling"), then finishes as
+        "cancelled" with every row received so far.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        with self.lock:
+            if job in self.pending:
+                self.pending.remove(job)
+                with job.lock:
+                    job.status = "cancelled"
+                    job.finished = time.time()
+                    job.publish()
+                return job
+        with job.lock:
+            if job.status != "running":
+                return job
+            job.cancelled = True
+            job.status = "cancelling"
+            job.publish()
+        job.engine.stop("Cancelled by user", drain_timeout=self.drain_timeout)
+        return job
+
+    def _start(self, job):
+        # Call with self.lock held
+        with job.lock:
+            job.status = "running"
+            job.publish()
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _run(self, job):
+        tag = f"[{job.label.upper()} {job.id}]"
+        engine = job.engine
+        status = "finished"
+        try:
+            engine.run()
+            if job.cancelled:
+                status = "cancelled"
+            elif engine.stop_reason:
+                print(f"{tag} ERROR {engine.stop_reason}. Stopping generation.")
+        except Exception as e:
+            print(f"{tag} ERROR Generation failed: {e}")
+            traceback.print_exc()
+            status = "failed"
+            job.error = str(e)
+        finally:
+            with job.lock:
+                job.status = status
+                job.finished = time.time()
+                job.publish()
+            self._job_done()
+
+    def _job_done(self):
+        """Start the next queued job and forget the oldest finished ones"""
+        with self.lock:
+            self.running -= 1
+            while self.pending and self.running < self.max_running:
+                self.running += 1
+                self._start(self.pending.popleft())
+            finished = [job_id for job_id, job in self.jobs.items() if not job.running]
+            for job_id in finished[:-self.max_finished]:
+                del self.jobs[job_id]
+
+    def _build_engine(self, job):
+        """Engine for `job` with callbacks that log and publish its progress"""
+        provider = self.provider
+        tag = f"[{job.label.upper()} {job.id}]"
+        total_rows = job.dataset_meta["total_rows"]
+        buffer = job.stream_buffer
+        stream_ids = {}  # batch number -> stream id
+
+        def on_batch_start(batch):
+            with job.lock:
+                stream_ids[batch.number] = buffer.start()
+                job.publish()
+
+        def on_chunk(batch, text):
+            with job.lock:
+                buffer.append(stream_ids[batch.number], text)
+                job.publish()
+
+        def on_retry(batch, delay):
+            print(f"{tag} WARNING Rate limited, retrying batch {batch.number} in {delay:.1f}s")
+
+        def on_rows(new_rows):
+            # Called with the engine's lock held; the critical section is the append
+            with job.lock:
+                job.rows.extend(new_rows)
+                job.publish()
+
+        def on_batch_end(batch):
+            if batch.rate_limited:
+                print(f"{tag} ERROR Still rate limited after {batch.retries} retries: {batch.error}")
+            elif batch.error:
+                print(f"{tag} ERROR API call failed: {batch.error}")
+            elif batch.aborted:
+                print(f"{tag} WARNING Response abandoned early ({batch.aborted}), kept {batch.received} rows")
+            elif not batch.is_json:
+                print(f"{tag} ERROR Response is not a JSON array")
+            elif batch.truncated:
+                print(f"{tag} WARNING Response truncated, kept {batch.received} complete rows")
+            print(f"{tag} Generated {batch.received} rows from API call")
+            if not batch.received:
+                print(f"{tag} WARNING Empty batch {engine.empty_batches}/{engine.max_empty_batches}")
+            else:
+                print(f"{tag} Added {batch.added} valid rows. Total: {engine.generated}/{total_rows}")
+                if batch.rejected:
+                    print(f"{tag} Rejected {batch.rejected.get(NearDuplicateFilter.name, 0)} near-duplicate rows")
+            with job.lock:
+                if batch.number in stream_ids:
+                    buffer.finish(stream_ids.pop(batch.number), "failed" if batch.error else "complete")
+                if not batch.replayed:
+                    job.api_call_count += 1
+                job.publish()
+
+        batch_sizer = None
+        if self.adaptive_batch:
+            batch_sizer = BatchSizer(job.batch_size, max_size=max(job.batch_size, self.max_batch_size),
+                                     max_output_tokens=provider.max_output_tokens)
+        stages = [NearDuplicateFilter(self.near_dup_threshold)] if self.near_dup_threshold else []
+        prompt_scheduler = None
+        if self.prompt_diversity:
+            prompt_scheduler = PromptScheduler(job.dataset_meta["description"], job.dataset_meta["columns"])
+        engine = GenerationEngine(
+            provider, job.dataset_meta["description"], job.dataset_meta["columns"], total_rows,
+            stages=stages, batch_size=job.batch_size, max_batch_size=self.max_batch_size, overfetch=2,
+            concurrency=self.concurrency, rate_limiter=self.rate_limiter, batch_sizer=batch_sizer,
+            prompt_scheduler=prompt_scheduler, metrics=self.metrics, executor=self.pool.executor(job.id),
+            on_batch_start=on_batch_start, on_chunk=on_chunk, on_retry=on_retry,
+            on_rows=on_rows, on_batch_end=on_batch_end,
+        )
+        return engine
@@ -0,0 +1,130 @@
+"""
+Incremental parser for JSON arrays that arrive in chunks.
+
+LLM responses are a JSON array of row objects streamed a few tokens at a
+time. JsonArrayParser yields each object as soon as its closing brace has
+arrived, so rows can be validated and deduplicated while the rest of the
+response is still streaming, and a truncated response still gives back
+every object that was complete.
+"""
+
+import json
+import re
+
+# Characters that can change nesting outside of a string
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+# Characters that can end (or escape inside) a string
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class JsonArrayParser:
+    """Pull complete objects out of a streamed JSON array.
+
+    Text before the first '[' (markdown fences, prose, or a {"data": ...}
+    wrapper) is skipped. Only objects that are direct items of that array are
+    returned; scanning stops once the array is closed.
+    """
+
+    def __init__(self):
+        self.started = False      # Seen the opening '[' of the array
+        self.done = False         # Seen its closing ']'
+        self.depth = 0            # Nesting depth, the array itself is 1
+        self.in_string = False
+        self.escape_pending = False  # Chunk ended right after a backslash
+        self.object_start = None  # Offset of the open object in the current chunk
+        self.pieces = []          # Text of the open object from earlier chunks
+        self.open_chars = 0       # Length of those pieces
+        self.objects = 0          # Objects parsed successfully
+        self.errors = 0           # Objects that were not valid JSON
+        self.chars = 0            # Characters fed so far
+
+    @property
+    def truncated(self):
+        """True if the array was opened but never closed"""
+        return self.started and not self.done
+
+    def feed(self, text):
+        """Consume the next chunk and return the objects it completed"""
+        completed = []
+        self.chars += len(text)
+        pos = 0
+        end = len(text)
+        if self.escape_pending and text:
+            self.escape_pending = False
+            pos = 1
+        while pos < end and not self.done:
+            if self.in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if not match:
+                    pos = end
+                    break
+                if match.group() == '\\':
+                    # Skip the escaped character, which may be in the next chunk
+                    if match.end() < end:
+                        pos = match.end() + 1
+                    else:
+                        self.escape_pending = True
+                        pos = end
+                    continue
+                self.in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if not match:
+                pos = end
+                break
+            char = match.group()
+            pos = match.end()
+
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                    self.depth = 1
+                continue
+
+            if char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 2 and char == '{':
+                    self.object_start = match.start()
+                    self.pieces = []
+                    self.open_chars = 0
+            else:
+                self.depth -= 1
+                if self.depth == 1 and self.object_start is not None:
+                    self.pieces.append(text[self.object_start:pos])
+                    self.object_start = None
+                    item = self._decode(''.join(self.pieces))
+                    self.pieces = []
+                    self.open_chars = 0
+                    if item is not None:
+                        completed.append(item)
+                elif self.depth <= 0:
+                    self.done = True
+
+        # Carry the unfinished object over to the next chunk
+        if self.object_start is not None:
+            self.pieces.append(text[self.object_start:])
+            self.open_chars += len(self.pieces[-1])
+            self.object_start = 0
+        return completed
+
+    def _decode(self, text):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            self.errors += 1
+            return None
+        self.objects += 1
+        return item
+
+
+def rows_from_items(items, columns):
+    """Convert parsed objects to rows in column order, skipping non-objects"""
+    rows = []
+    for item in items:
+        if isinstance(item, dict):
+            rows.append([str(item.get(col, "")).strip() for col in columns])
+    return rows
@@ -0,0 +1,188 @@
+"""
+Run metrics in the Prometheus text format.
+
+Metrics keeps counters and histograms for everything a GenerationEngine
+does, updated once per finished batch: where each request's time went
+(waiting for the first token, streaming, parsing, validating, deduplicating,
+storing, waiting for the merge lock) and what became of its rows. The web
+apps serve render() at /metrics; the CLI writes it to a file that a
+node_exporter textfile collector can pick up. Nothing is updated per chunk,
+so recording costs the same however a response is streamed.
+"""
+
+import bisect
+import os
+import threading
+
+# Seconds from sending a request to its first / last response chunk
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Seconds one batch spends in a pipeline stage (parse, dedup, ...)
+STAGE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+# Batch stage -> (metric name, help)
+STAGE_METRICS = {
+    "parse": ("parse_seconds", "Time per batch spent parsing streamed JSON"),
+    "validate": ("validate_seconds", "Time per batch spent validating rows"),
+    "dedup": ("dedup_seconds", "Time per batch spent in the dedup index and row filters"),
+    "store": ("store_seconds", "Time per batch spent storing accepted rows"),
+    "lock_wait": ("lock_wait_seconds", "Time per batch spent waiting for the merge lock"),
+}
+
+
+def format_value(value):
+    """Sample value as Prometheus expects it"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+               for value in labels.values())
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + "}"
+
+
+class Counter:
+    """Monotonic count, optionally split by one label (update with the registry lock held)"""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}  # label value (None without a label) -> count
+
+    def inc(self, amount=1, label_value=None):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        # An unlabelled counter is shown from the start, a labelled one once it has a value
+        values = self.values.items() if self.values or self.label else [(None, 0)]
+        for label_value, value in values:
+            labels = {self.label: label_value} if self.label else {}
+            lines.append(f"{self.name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (update with the registry lock held)"""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last slot: above every bucket
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{format_value(bound)}"}} {total}')
+        lines.append(f"{self.name}_sum {format_value(self.sum)}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class Metrics:
+    """Counters and histograms of one process, shared by all its engines.
+
+    Pass it to GenerationEngine(metrics=...). gauge() adds values read at
+    render time, such as running jobs or the current concurrency limit.
+    """
+
+    def __init__(self, prefix="datagen"):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.metrics = []
+        self.gauges = []  # (name, help, fn)
+        self.api_latency = self._histogram(
+            "api_latency_seconds", "Seconds from sending a request to the end of its response", LATENCY_BUCKETS)
+        self.first_token = self._histogram(
+            "time_to_first_token_seconds", "Seconds from sending a request to its first response chunk",
+            LATENCY_BUCKETS)
+        self.stage_times = {stage: self._histogram(name, help, STAGE_BUCKETS)
+                            for stage, (name, help) in STAGE_METRICS.items()}
+        self.batches = self._counter("batches_total", "Finished batch requests")
+        self.replayed = self._counter("replayed_batches_total", "Batches served from the response cache")
+        self.errors = self._counter("api_errors_total", "Batch requests that failed")
+        self.retries = self._counter("retries_total", "Requests retried after a rate limit")
+        self.truncated = self._counter("truncated_responses_total", "Responses cut off before the array closed")
+        self.aborted = self._counter("aborted_responses_total", "Responses abandoned early (runaway or garbage)")
+        self.response_chars = self._counter("response_chars_total", "Characters received from the API")
+        self.parse_errors = self._counter("parse_errors_total", "Response objects that were not valid JSON")
+        self.rows_requested = self._counter("rows_requested_total", "Rows asked for in batch requests")
+        self.rows_accepted = self._counter("rows_accepted_total", "Rows accepted into a dataset")
+        self.rows_duplicate = self._counter("rows_duplicate_total", "Rows rejected as exact duplicates")
+        self.rows_invalid = self._counter("rows_invalid_total", "Rows that failed validation")
+        self.rows_rejected = self._counter("rows_rejected_total", "Rows rejected by a row filter", label="stage")
+
+    def _counter(self, name, help, label=None):
+        metric = Counter(f"{self.prefix}_{name}", help, label)
+        self.metrics.append(metric)
+        return metric
+
+    def _histogram(self, name, help, buckets):
+        metric = Histogram(f"{self.prefix}_{name}", help, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, fn):
+        """Report fn() as gauge `name` on every render"""
+        self.gauges.append((f"{self.prefix}_{name}", help, fn))
+
+    def observe_batch(self, batch):
+        """Record a finished engine.Batch"""
+        with self.lock:
+            if batch.replayed:
+                self.replayed.inc()
+            else:
+                self.batches.inc()
+            self.rows_requested.inc(batch.size)
+            self.retries.inc(batch.retries)
+            if batch.error:
+                self.errors.inc()
+            if batch.truncated:
+                self.truncated.inc()
+            if batch.aborted:
+                self.aborted.inc()
+            self.response_chars.inc(batch.chars)
+            self.parse_errors.inc(batch.parse_errors)
+            self.rows_accepted.inc(batch.added)
+            self.rows_duplicate.inc(batch.duplicates)
+            self.rows_invalid.inc(batch.invalid)
+            for stage, count in batch.rejected.items():
+                self.rows_rejected.inc(count, stage)
+            # A replay says nothing about the API's latency
+            if batch.requested is not None and not batch.error and not batch.replayed:
+                self.api_latency.observe(batch.finished - batch.requested)
+            if batch.requested is not None and batch.first_chunk is not None and not batch.replayed:
+                self.first_token.observe(batch.first_chunk - batch.requested)
+            for stage, seconds in batch.times.items():
+                self.stage_times[stage].observe(seconds)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self.lock:
+            lines = [line for metric in self.metrics for line in metric.render()]
+        for name, help, fn in self.gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {format_value(fn())}"]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """Atomically replace `path` with render(), for textfile collectors"""
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp, path)
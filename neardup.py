@@ -0,0 +1,178 @@
+"""
+Near-duplicate detection with MinHash-LSH.
+
+Rows that differ only in casing, punctuation or a word or two pass the
+exact digest check in dedup.py. NearDuplicateFilter normalizes each row,
+takes a MinHash signature of its word shingles and looks it up in an LSH
+index, so each row is compared only against the few earlier rows that share
+a band with it instead of against the whole dataset.
+
+It plugs into GenerationEngine as a row stage: any object with a `name`,
+admit(row) -> bool (accept and remember, or reject) and add(row) (remember
+a row that is already in the dataset, e.g. when resuming).
+"""
+
+import math
+import re
+from array import array
+
+MASK64 = (1 << 64) - 1
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """Lowercased words with punctuation and extra whitespace removed"""
+    return _WORD.findall(text.lower())
+
+
+def shingle_hashes(row, size=3):
+    """Hashes of the word `size`-grams of a row (whole words for short rows)"""
+    words = normalize(" ".join(row))
+    if len(words) < size:
+        return {hash(word) & MASK64 for word in words}
+    return {hash(tuple(words[i:i + size])) & MASK64 for i in range(len(words) - size + 1)}
+
+
+def lsh_params(num_perm, threshold):
+    """(bands, rows per band) whose LSH curve starts catching pairs a bit below
+    `threshold`; candidates are verified afterwards, so missing pairs costs
+    more than a few extra comparisons"""
+    target = threshold * 0.8
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - target)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class _BandTable:
+    """Open-addressing multimap of 64-bit band keys to row ids"""
+
+    def __init__(self, capacity=1024):
+        self.capacity = 1 << max(4, math.ceil(math.log2(capacity * 2)))
+        self.keys = array('Q', [0]) * self.capacity
+        self.ids = array('I', [0]) * self.capacity
+        self.count = 0
+
+    def get(self, key):
+        """Row ids stored under `key`"""
+        mask = self.capacity - 1
+        slot = key & mask
+        keys = self.keys
+        found = []
+        while keys[slot]:
+            if keys[slot] == key:
+                found.append(self.ids[slot])
+            slot = (slot + 1) & mask
+        return found
+
+    def put(self, key, row_id):
+        mask = self.capacity - 1
+        slot = key & mask
+        while self.keys[slot]:
+            slot = (slot + 1) & mask
+        self.keys[slot] = key
+        self.ids[slot] = row_id
+        self.count += 1
+        if self.count * 2 > self.capacity:
+            self._grow()
+
+    def _grow(self):
+        old_keys, old_ids = self.keys, self.ids
+        self.capacity *= 2
+        self.keys = array('Q', [0]) * self.capacity
+        self.ids = array('I', [0]) * self.capacity
+        self.count = 0
+        for key, row_id in zip(old_keys, old_ids):
+            if key:
+                self.put(key, row_id)
+
+
+class NearDuplicateFilter:
+    """Reject rows whose estimated Jaccard similarity to an earlier row is at
+    least `threshold`.
+
+    Signatures use one-permutation MinHash: each shingle is hashed once and
+    kept as the minimum of one of `num_perm` bins, so a signature costs one
+    pass over the shingles. Memory is about (4 * num_perm + 24 * bands)
+    bytes per row.
+    """
+
+    name = "near_duplicates"
+
+    def __init__(self, threshold=0.8, num_perm=32, shingle_size=3):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows_per_band = lsh_params(num_perm, threshold)
+        self.signatures = array('I')  # num_perm values per stored row
+        self.table = _BandTable()
+        self.count = 0
+        self.comparisons = 0
+
+    def __len__(self):
+        return self.count
+
+    def signature(self, row):
+        bins = self.num_perm
+        mins = [None] * bins
+        for h in shingle_hashes(row, self.shingle_size):
+            b = h % bins
+            value = (h // bins) & 0xFFFFFFFF
+            if mins[b] is None or value < mins[b]:
+                mins[b] = value
+        if all(value is None for value in mins):
+            return None
+        # Densify: an empty bin borrows from the next filled bin to its right
+        for b in range(bins):
+            if mins[b] is None:
+                step = 1
+                while mins[(b + step) % bins] is None:
+                    step += 1
+                mins[b] = (mins[(b + step) % bins] + step * 0x9E3779B1) & 0xFFFFFFFF
+        return mins
+
+    def _band_keys(self, signature):
+        r = self.rows_per_band
+        return [(hash((band, *signature[band * r:(band + 1) * r])) & MASK64) or 1
+                for band in range(self.bands)]
+
+    def _similarity(self, signature, row_id):
+        start = row_id * self.num_perm
+        stored = self.signatures[start:start + self.num_perm]
+        return sum(a == b for a, b in zip(signature, stored)) / self.num_perm
+
+    def _store(self, signature, keys):
+        row_id = self.count
+        self.signatures.extend(signature)
+        for key in keys:
+            self.table.put(key, row_id)
+        self.count += 1
+
+    def admit(self, row):
+        """Remember `row` and return True, or return False if it is a near duplicate"""
+        signature = self.signature(row)
+        if signature is None:
+            return True
+        keys = self._band_keys(signature)
+        checked = set()
+        for key in keys:
+            for row_id in self.table.get(key):
+                if row_id in checked:
+                    continue
+                checked.add(row_id)
+                self.comparisons += 1
+                if self._similarity(signature, row_id) >= self.threshold:
+                    return False
+        self._store(signature, keys)
+        return True
+
+    def add(self, row):
+        """Remember `row` without checking it"""
+        signature = self.signature(row)
+        if signature is not None:
+            self._store(signature, self._band_keys(signature))
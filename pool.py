@@ -0,0 +1,102 @@
+"""
+Daemon worker pool for batch requests.
+
+FairPool runs requests on daemon threads. Unlike ThreadPoolExecutor
+workers, which the interpreter joins at exit, a request abandoned after
+GenerationEngine.stop() cannot delay exit until it times out. Requests are
+queued per key (e.g. per web job) and served round-robin; executor(key)
+gives the engine a ThreadPoolExecutor-like handle for one key.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+
+class FairPool:
+    """Worker threads shared by several request queues.
+
+    Each key has its own queue of requests and idle workers take the next
+    request from the key served least recently, so a key with a deep queue
+    cannot starve the others.
+    """
+
+    def __init__(self, workers):
+        self.queues = OrderedDict()  # key -> deque of (future, fn, args)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(max(1, workers))]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, key, fn, *args):
+        future = Future()
+        with self.cond:
+            self.queues.setdefault(key, deque()).append((future, fn, args))
+            self.cond.notify()
+        return future
+
+    def cancel(self, key):
+        """Cancel every request of `key` that has not started yet"""
+        with self.cond:
+            for future, _, _ in self.queues.pop(key, ()):
+                future.cancel()
+
+    def close(self):
+        """Stop the workers once every queued request has run"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def executor(self, key, owned=False):
+        """ThreadPoolExecutor-like handle submitting work for `key`.
+
+        An `owned` handle closes the whole pool on shutdown(); use it for a
+        pool created for a single caller.
+        """
+        return _PoolExecutor(self, key, owned)
+
+    def _next(self):
+        # Call with cond held. The first key with work is the one served least
+        # recently; it moves to the back once served.
+        for key, queue in self.queues.items():
+            if queue:
+                item = queue.popleft()
+                self.queues.move_to_end(key)
+                return item
+        return None
+
+    def _work(self):
+        while True:
+            with self.cond:
+                # A request, or True once the pool is closed and drained
+                item = self.cond.wait_for(lambda: self._next() or self.closed)
+            if item is True:
+                return
+            future, fn, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class _PoolExecutor:
+    """The part of the Executor interface GenerationEngine uses"""
+
+    def __init__(self, pool, key, owned=False):
+        self.pool = pool
+        self.key = key
+        self.owned = owned
+
+    def submit(self, fn, *args):
+        return self.pool.submit(self.key, fn, *args)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if cancel_futures:
+            self.pool.cancel(self.key)
+        if self.owned:
+            self.pool.close()
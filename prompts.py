@@ -0,0 +1,134 @@
+"""
+Diversity-steered prompt scheduling.
+
+With one fixed prompt the model keeps drawing from the same few ideas, so
+the share of rows rejected as duplicates grows with the dataset. The
+PromptScheduler gives every batch a variant of the prompt instead:
+
+  topic shards      one focus per variant (given, or generic angles)
+  attribute grids   every combination of the given attribute values
+  negative examples a few already accepted rows the model must not repeat
+
+and keeps, per variant, the share of requested rows that were accepted.
+Variants are chosen with UCB1, so the ones with the best yield get most of
+the batches while the others are still retried now and then.
+"""
+
+import itertools
+import math
+import random
+import threading
+
+from engine import build_prompt
+
+# Used when no topics are given: angles that pull most datasets apart
+DEFAULT_TOPICS = (
+    "everyday situations",
+    "professional or technical contexts",
+    "uncommon edge cases",
+    "short, simple entries",
+    "long, detailed entries",
+    "different countries and cultures",
+    "historical or future settings",
+    "informal, conversational tone",
+)
+
+
+class PromptScheduler:
+    """Pick a prompt variant for each batch and learn which ones yield best.
+
+    `topics` is a list of focus strings and `attributes` maps an attribute
+    name to its values; the variants are their cross product. Up to
+    `negatives` accepted rows (cells cut to `negative_chars`) are quoted in
+    each prompt as examples not to repeat.
+    """
+
+    def __init__(self, description, columns, topics=None, attributes=None, negatives=5,
+                 negative_chars=120, reservoir_size=500, exploration=0.5, seed=None):
+        self.description = description
+        self.columns = columns
+        self.negatives = negatives
+        self.negative_chars = negative_chars
+        self.reservoir_size = reservoir_size
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        topics = list(topics or DEFAULT_TOPICS)
+        attributes = attributes or {}
+        grid = [[(name, value) for value in values] for name, values in attributes.items()]
+        self.variants = [(topic, combo) for topic in topics for combo in itertools.product(*grid)]
+        self.requested = [0] * len(self.variants)
+        self.accepted = [0] * len(self.variants)
+        self.duplicates = [0] * len(self.variants)
+        self.received = [0] * len(self.variants)
+        self.batches = [0] * len(self.variants)
+        self.reservoir = []  # Uniform sample of accepted rows
+        self.seen_rows = 0
+        self.lock = threading.Lock()
+
+    def _pick(self):
+        # Call with lock held. Untried variants first, then UCB1 on yield.
+        untried = [i for i, count in enumerate(self.batches) if not count]
+        if untried:
+            return self.rng.choice(untried)
+        total = math.log(sum(self.batches))
+        return max(range(len(self.variants)), key=lambda i: (
+            self.accepted[i] / max(1, self.requested[i])
+            + self.exploration * math.sqrt(total / self.batches[i])))
+
+    def _steering(self, variant, examples):
+        topic, combo = variant
+        lines = [f"Focus this batch on: {topic}."]
+        if combo:
+            lines.append("Every entry in this batch should have: "
+                         + ", ".join(f"{name} = {value}" for name, value in combo) + ".")
+        if examples:
+            lines.append("These entries already exist. Do NOT repeat or paraphrase them:")
+            for row in examples:
+                cells = (cell if len(cell) <= self.negative_chars else cell[:self.negative_chars] + "..."
+                         for cell in row)
+                lines.append("- " + " | ".join(cells))
+        return "\n".join(lines)
+
+    def next_prompt(self, batch_size):
+        """Return (variant index, prompt) for the next batch"""
+        with self.lock:
+            index = self._pick()
+            self.batches[index] += 1  # Counted at dispatch so parallel picks spread out
+            count = min(self.negatives, len(self.reservoir))
+            examples = self.rng.sample(self.reservoir, count) if count else []
+        steering = self._steering(self.variants[index], examples)
+        return index, build_prompt(self.description, self.columns, batch_size, steering)
+
+    def remember(self, rows):
+        """Offer accepted rows to the negative-example reservoir"""
+        with self.lock:
+            for row in rows:
+                self.seen_rows += 1
+                if len(self.reservoir) < self.reservoir_size:
+                    self.reservoir.append(row)
+                else:
+                    slot = self.rng.randrange(self.seen_rows)
+                    if slot < self.reservoir_size:
+                        self.reservoir[slot] = row
+
+    def record(self, batch):
+        """Update the yield of the variant `batch` was generated with"""
+        if batch.variant is None or batch.stopped or (batch.error and not batch.chars):
+            return  # Failed, or cut short by the engine: says nothing about the variant
+        with self.lock:
+            self.requested[batch.variant] += batch.size
+            self.accepted[batch.variant] += batch.added
+            self.received[batch.variant] += batch.received
+            self.duplicates[batch.variant] += batch.duplicates
+
+    def describe(self, index):
+        topic, combo = self.variants[index]
+        return ", ".join([topic] + [f"{name}={value}" for name, value in combo])
+
+    def summary(self, top=5):
+        """Best variants so far as (description, yield, duplicate rate, batches)"""
+        with self.lock:
+            stats = [(self.describe(i), self.accepted[i] / self.requested[i],
+                      self.duplicates[i] / max(1, self.received[i]), self.batches[i])
+                     for i in range(len(self.variants)) if self.requested[i]]
+        return sorted(stats, key=lambda item: item[1], reverse=True)[:top]
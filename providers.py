@@ -0,0 +1,308 @@
+"""
+LLM providers for the dataset generator.
+
+A provider turns a prompt into a stream of response text chunks. The
+generation engine does everything else (parsing, validation, dedup), so the
+web apps and the CLI share one code path no matter which API is used.
+
+SDKs are imported and clients created on the first request, not when a
+provider is created, so only the SDK for the provider actually in use needs
+to be installed and `--help`, config checks and server startup never pay
+for loading it. Each provider then reuses its clients for every batch and
+worker thread, so requests go over warm keep-alive connections instead of
+paying for a new client and TLS handshake per batch.
+"""
+
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+
+class Provider:
+    """Base class for LLM providers"""
+
+    name = "provider"
+    label = "LLM"  # Used in log tags and user-facing messages
+    max_output_tokens = None  # Response token limit, if known
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def config_error(self):
+        """Why requests would fail before being sent (e.g. a missing key), or None.
+
+        Never loads the SDK.
+        """
+        return None
+
+    def replay(self, prompt, columns, batch_size):
+        """Response text that can be served without calling the API, or None.
+
+        The engine asks before taking rate-limit budget, so a replayed
+        response (see cache.CachedProvider) costs no quota. When it returns
+        None, the same thread calls stream() for the request next.
+        """
+        return None
+
+    def stream(self, prompt, columns, batch_size):
+        """Yield the response text for one batch request in chunks"""
+        raise NotImplementedError
+
+
+def _placeholder_key(api_key):
+    return not api_key or api_key == "your_api_key_here"
+
+
+class OpenAIProvider(Provider):
+    """Any OpenAI-compatible chat completions API"""
+
+    name = "openai"
+    label = "LLM"
+
+    SYSTEM_PROMPT = (
+        "You are a precise dataset generator. Follow the user's description EXACTLY. "
+        "Output ONLY a valid JSON array of objects, no explanations. Each object "
+        "represents one complete dataset entry. Ensure the JSON is complete and valid."
+    )
+
+    def __init__(self, api_key, base_url=None, model_name="gpt-3.5-turbo", max_tokens=64000,
+                 max_connections=8, timeout=120.0):
+        super().__init__(model_name)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_output_tokens = max_tokens
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self.lock = threading.Lock()
+
+    def config_error(self):
+        if _placeholder_key(self.api_key):
+            return "API_KEY is not set or is using the default placeholder. Please set a valid API key in your .env file."
+        return None
+
+    @property
+    def client(self):
+        """The OpenAI client, created on first use"""
+        if self._client is None:
+            with self.lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        import openai
+        # One client shared by all worker threads (the SDK's HTTP clients are
+        # thread-safe), with a keep-alive pool sized to the number of batches
+        # in flight. The read timeout is the longest gap allowed between
+        # streamed chunks. The pool types come from the SDK itself, since
+        # which HTTP package it is built on differs between releases.
+        timeout = openai.Timeout(self.timeout, connect=10.0)
+        default_limits = getattr(openai, "DEFAULT_CONNECTION_LIMITS", None)
+        client_class = getattr(openai, "DefaultHttpxClient", None)
+        if default_limits is None or client_class is None:
+            return openai.OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=timeout)
+        limits = type(default_limits)(max_connections=self.max_connections,
+                                      max_keepalive_connections=self.max_connections, keepalive_expiry=120)
+        http_client = client_class(limits=limits, timeout=timeout)
+        return openai.OpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client)
+
+    def stream(self, prompt, columns, batch_size):
+        response = self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": self.SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=1,
+            max_tokens=self.max_output_tokens,
+            stream=True,
+        )
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            # Also runs when the engine stops reading early: drop the connection
+            # so the server stops generating
+            response.close()
+
+
+class GeminiProvider(Provider):
+    """Google Gemini in streaming JSON mode"""
+
+    name = "gemini"
+    label = "Gemini"
+
+    def __init__(self, api_key, model_name="gemini-2.5-flash", max_output_tokens=32000, timeout=600.0):
+        super().__init__(model_name)
+        self.api_key = api_key
+        self.max_output_tokens = max_output_tokens
+        self.timeout = timeout  # Deadline for a whole streamed response
+        self.local = threading.local()  # One GenerativeModel per worker thread
+        self._genai = None
+        self.lock = threading.Lock()
+
+    def config_error(self):
+        if _placeholder_key(self.api_key):
+            return "GEMINI_API_KEY is not set. Please set it in your .env file."
+        return None
+
+    @property
+    def genai(self):
+        """The configured google.generativeai module, imported on first use"""
+        if self._genai is None:
+            with self.lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def model(self):
+        """This thread's GenerativeModel, created on first use and kept for the run.
+
+        The models share the SDK's client and its open connection.
+        """
+        model = getattr(self.local, "model", None)
+        if model is None:
+            model = self.local.model = self.genai.GenerativeModel(
+                model_name=self.model_name,
+                generation_config={
+                    "temperature": 1,
+                    "max_output_tokens": self.max_output_tokens,
+                    "response_mime_type": "application/json",
+                }
+            )
+        return model
+
+    def stream(self, prompt, columns, batch_size):
+        response = self.model().generate_content(prompt, stream=True,
+                                                 request_options={"timeout": self.timeout})
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class MockRateLimitError(Exception):
+    """Simulated 429 response from the mock provider"""
+
+    status_code = 429
+
+
+class MockProvider(Provider):
+    """Deterministic offline provider that needs no API key.
+
+    Each call returns `batch_size` rows built from a seeded random generator,
+    streamed in small chunks, so the whole pipeline can run without network
+    access. The knobs below simulate a real API for benchmarks:
+
+      latency            seconds before the first chunk
+      tokens_per_sec     streaming speed (0 = as fast as possible, ~4 chars/token)
+      malformed_rate     chance that an object in the array is broken JSON
+      truncate_rate      chance that a response is cut off part way through
+      duplicate_rate     chance that a row repeats one returned earlier
+      near_duplicate_rate  chance that a row repeats an earlier one with different
+                         casing and punctuation
+      rate_limit_rate    chance that a call fails with a simulated 429
+      max_output_tokens  cut responses off at this many tokens (0 = no limit)
+      cell_words         words per generated cell
+    """
+
+    name = "mock"
+    label = "Mock"
+
+    WORDS = ("the", "a", "report", "city", "market", "said", "new", "people", "year",
+             "government", "after", "police", "team", "first", "water", "school",
+             "officials", "quickly", "plan", "week", "local", "record", "storm", "deal")
+
+    def __init__(self, model_name="mock", seed=0, chunk_size=64, latency=0.0,
+                 tokens_per_sec=0, malformed_rate=0.0, truncate_rate=0.0,
+                 duplicate_rate=0.0, near_duplicate_rate=0.0, rate_limit_rate=0.0, max_output_tokens=0, cell_words=8):
+        super().__init__(model_name)
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.malformed_rate = malformed_rate
+        self.truncate_rate = truncate_rate
+        self.duplicate_rate = duplicate_rate
+        self.near_duplicate_rate = near_duplicate_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_output_tokens = max_output_tokens or None
+        self.cell_words = cell_words
+        self.calls = itertools.count(1)
+        self.recent = []  # Earlier rows, the source of simulated duplicates
+
+    def make_items(self, rng, columns, batch_size):
+        items = []
+        for _ in range(batch_size):
+            if self.recent and rng.random() < self.duplicate_rate:
+                items.append(rng.choice(self.recent))
+                continue
+            if self.recent and rng.random() < self.near_duplicate_rate:
+                item = dict(rng.choice(self.recent))
+                col = rng.choice(columns)
+                item[col] = item[col].capitalize() + rng.choice(".!?")
+                items.append(item)
+                continue
+            item = {
+                col: " ".join(rng.choice(self.WORDS) for _ in range(self.cell_words)) + f" {rng.randrange(10 ** 9)}"
+                for col in columns
+            }
+            items.append(item)
+        self.recent = (self.recent + items)[-1000:]
+        return items
+
+    def stream(self, prompt, columns, batch_size):
+        rng = random.Random(f"{self.seed}-{next(self.calls)}")
+        if rng.random() < self.rate_limit_rate:
+            if self.latency:
+                time.sleep(self.latency)
+            raise MockRateLimitError("429 Too Many Requests (simulated). Please retry in 0.5s")
+        items = self.make_items(rng, columns, batch_size)
+        parts = []
+        for item in items:
+            text = json.dumps(item, ensure_ascii=False)
+            if rng.random() < self.malformed_rate:
+                text = text.replace('":', '"', 1)
+            parts.append(text)
+        text = "[" + ", ".join(parts) + "]"
+        if rng.random() < self.truncate_rate:
+            text = text[:rng.randrange(1, len(text))]
+        if self.max_output_tokens:
+            text = text[:self.max_output_tokens * 4]
+
+        if self.latency:
+            time.sleep(self.latency)
+        delay = self.chunk_size / 4 / self.tokens_per_sec if self.tokens_per_sec else 0
+        for start in range(0, len(text), self.chunk_size):
+            if delay:
+                time.sleep(delay)
+            yield text[start:start + self.chunk_size]
+
+
+def create_provider(name, max_connections=8):
+    """Create a provider from environment settings (the SDK is loaded on first use).
+
+    `max_connections` sizes the HTTP connection pool (use the number of
+    batches kept in flight). Raises ValueError if the provider is unknown or
+    its API key is missing.
+    """
+    if name == "openai":
+        provider = OpenAIProvider(os.getenv("API_KEY"), os.getenv("BASE_URL"),
+                                  os.getenv("MODEL_NAME", "gpt-3.5-turbo"), max_connections=max_connections)
+    elif name == "gemini":
+        # The CLI's default model, unlike gemini.py's
+        provider = GeminiProvider(os.getenv("GEMINI_API_KEY"), os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash"))
+    elif name == "mock":
+        provider = MockProvider()
+    else:
+        raise ValueError(f"Unknown provider: {name}")
+    error = provider.config_error()
+    if error:
+        raise ValueError(error)
+    return provider
@@ -0,0 +1,174 @@
+"""
+Shared rate limiting for LLM requests.
+
+RateLimiter keeps all workers of a run under a requests/min and tokens/min
+budget, recognizes 429 / quota errors from any provider, backs off with
+jittered exponential delays (honouring retry-after hints), and tunes the
+number of batches in flight AIMD-style: halve on a burst of rate limits, grow by one
+after a window of clean requests.
+"""
+
+import random
+import re
+import threading
+import time
+
+# Phrases providers use for quota errors when no status code is available
+_RATE_LIMIT_MARKERS = ("429", "rate limit", "rate_limit", "resource_exhausted",
+                       "resource has been exhausted", "quota", "too many requests")
+# "Please retry in 12.5s" / "retry_delay { seconds: 12 }"
+_RETRY_HINT = re.compile(r"retry in ([\d.]+)\s*s|retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE)
+
+
+def pause(seconds, stop=None):
+    """Sleep for `seconds`, or until the `stop` Event is set; return whether it was"""
+    if stop is None:
+        time.sleep(seconds)
+        return False
+    return stop.wait(seconds)
+
+
+def rate_limit_info(error):
+    """Return (is_rate_limited, retry_after_seconds or None) for an exception"""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if callable(status):
+        status = status()
+    message = str(error)
+    limited = status == 429 or any(marker in message.lower() for marker in _RATE_LIMIT_MARKERS)
+    if not limited:
+        return False, None
+
+    retry_after = None
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        try:
+            retry_after = float(value) if value is not None else None
+        except ValueError:
+            retry_after = None
+    if retry_after is None:
+        match = _RETRY_HINT.search(message)
+        if match:
+            retry_after = float(match.group(1) or match.group(2))
+    return True, retry_after
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `per_minute` units per minute.
+
+    A rate of 0 means unlimited. The level may go negative when actual usage
+    turns out higher than estimated; later callers then wait off the debt.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1, stop=None):
+        """Block until `amount` units are available, then take them.
+
+        Returns False without taking anything if the `stop` Event is set first.
+        """
+        if not self.rate:
+            return True
+        # Requests larger than the whole bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return True
+                wait_time = (amount - self.level) / self.rate
+            if pause(min(wait_time, 5.0), stop):
+                return False
+
+    def adjust(self, amount):
+        """Charge (or refund, if negative) units after the fact"""
+        if not self.rate:
+            return
+        with self.lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """Request/token budgets, 429 backoff and adaptive concurrency for one run"""
+
+    def __init__(self, requests_per_min=0, tokens_per_min=0, max_concurrency=1,
+                 base_delay=2.0, max_delay=120.0, max_retries=6):
+        self.requests = TokenBucket(requests_per_min)
+        self.tokens = TokenBucket(tokens_per_min)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.concurrency_limit = self.max_concurrency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retries = max_retries
+        self.cooldown_until = 0.0   # Shared pause after a 429, for all workers
+        self.rate_limited = 0       # 429s seen
+        self.clean_streak = 0       # Successes since the last limit change
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens, stop=None):
+        """Wait for any cooldown and for budget to send one request.
+
+        Returns False, with no budget taken, if the `stop` Event is set first.
+        """
+        while True:
+            with self.lock:
+                cooldown = self.cooldown_until - time.monotonic()
+            if cooldown <= 0:
+                break
+            if pause(cooldown, stop):
+                return False
+        if not self.requests.acquire(1, stop):
+            return False
+        if not self.tokens.acquire(estimated_tokens, stop):
+            self.requests.adjust(-1)
+            return False
+        return True
+
+    def record_tokens(self, estimated_tokens, actual_tokens):
+        """Correct the token budget once the real usage is known"""
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Jittered exponential backoff, never shorter than a retry-after hint"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = random.uniform(delay / 2, delay)
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def on_rate_limited(self, attempt, retry_after=None):
+        """Record a 429: halve concurrency, pause everyone, return the delay.
+
+        The 429s of one burst arrive together, so concurrency is halved only
+        once per cooldown window.
+        """
+        delay = self.backoff_delay(attempt, retry_after)
+        now = time.monotonic()
+        with self.lock:
+            self.rate_limited += 1
+            self.clean_streak = 0
+            if now >= self.cooldown_until:
+                self.concurrency_limit = max(1, self.concurrency_limit // 2)
+            self.cooldown_until = max(self.cooldown_until, now + delay)
+        return delay
+
+    def on_success(self):
+        """Grow concurrency by one after a full window of clean requests"""
+        with self.lock:
+            self.clean_streak += 1
+            if self.concurrency_limit < self.max_concurrency and self.clean_streak >= self.concurrency_limit:
+                self.concurrency_limit += 1
+                self.clean_streak = 0
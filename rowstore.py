@@ -0,0 +1,86 @@
+"""
+Append-only columnar row store.
+
+RowStore keeps each column as one UTF-8 bytearray arena plus an array of
+end offsets, instead of a Python list and str object per cell, so a row
+costs its encoded text plus 8 bytes per column. Rows are never modified
+once appended, so a snapshot is just a row count: readers take one, drop
+the lock and read rows [0, count) while the writer keeps appending.
+"""
+
+from array import array
+
+
+class RowStore:
+    """Append-only table of string rows stored column by column.
+
+    Appends must be serialized by the caller (one writer). Readers may run
+    concurrently as long as they only read rows below a count taken from
+    len() or snapshot(), since the count is bumped after a row is complete.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.arenas = [bytearray() for _ in self.columns]
+        self.offsets = [array('Q', [0]) for _ in self.columns]  # offsets[c][i:i+2] bounds row i
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        for arena, offsets, cell in zip(self.arenas, self.offsets, row):
+            arena.extend(cell.encode('utf-8'))
+            offsets.append(len(arena))
+        self.count += 1
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def row(self, index):
+        """Row `index` as a list of strings"""
+        return [arena[offsets[index]:offsets[index + 1]].decode('utf-8')
+                for arena, offsets in zip(self.arenas, self.offsets)]
+
+    def snapshot(self, stop=None):
+        """Immutable view of the first `stop` rows (default: all rows so far)"""
+        return RowSnapshot(self, 0, self.count if stop is None else min(stop, self.count))
+
+    def nbytes(self):
+        """Approximate memory used by the stored rows"""
+        return sum(len(arena) + offsets.itemsize * len(offsets)
+                   for arena, offsets in zip(self.arenas, self.offsets))
+
+
+class RowSnapshot:
+    """Fixed range of rows of a RowStore.
+
+    Slicing returns another view without copying; rows are decoded only
+    when iterated or indexed.
+    """
+
+    def __init__(self, store, start, stop):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("RowSnapshot slices do not support a step")
+            return RowSnapshot(self.store, self.start + start, self.start + max(start, stop))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("row index out of range")
+        return self.store.row(self.start + key)
+
+    def __iter__(self):
+        row = self.store.row
+        for index in range(self.start, self.stop):
+            yield row(index)
@@ -5,14 +5,30 @@ const progressText = document.getElementById("progress-text");
 const downloadButtons = document.getElementById("download-buttons");
 const downloadCsvBtn = document.getElementById("download-csv-btn");
 const downloadJsonBtn = document.getElementById("download-json-btn");
+const downloadJsonlBtn = document.getElementById("download-jsonl-btn");
+const cancelBtn = document.getElementById("cancel-btn");
 const errorMessage = document.getElementById("error-message");
 const streamArea = document.getElementById("stream-area");
 const streamContent = document.getElementById("stream-content");
 const csvPreviewArea = document.getElementById("csv-preview-area");
 const csvPreview = document.getElementById("csv-preview");
 
+// The page follows one job at a time: the open /events stream, and a counter
+// that ends the polling loop of an earlier job
+let eventSource = null;
+let followId = 0;
+
+function stopFollowing() {
+  if (eventSource) {
+    eventSource.close();
+    eventSource = null;
+  }
+  followId += 1;
+}
+
 form.addEventListener("submit", async function (e) {
   e.preventDefault();
+  stopFollowing();
   errorMessage.style.display = "none";
   streamArea.style.display = "none";
   streamContent.innerHTML = "";
@@ -22,6 +38,8 @@ form.addEventListener("submit", async function (e) {
   downloadButtons.style.display = "none";
   setProgressBar(0);
   progressText.innerText = "Starting...";
+  cancelBtn.disabled = false;
+  cancelBtn.style.display = "inline-block";
 
   const description = document.getElementById("description").value;
   const columns = document
@@ -42,10 +60,101 @@ form.addEventListener("submit", async function (e) {
     showError("Failed to start generation.");
     return;
   }
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    showError(data.message || "Failed to start generation.");
+    return;
+  }
+
+  liveCsvEtag = null;
+  if (window.EventSource) {
+    followEvents();
+  } else {
+    await pollProgress();
+  }
+});
+
+function showProgress(data) {
+  showWarning(data.warning);
+  const percent = data.total
+    ? Math.floor((data.generated / data.total) * 100)
+    : 0;
+  setProgressBar(percent);
+  progressText.innerText = `${data.generated} / ${data.total} rows generated`;
+  // Show API call count
+  showApiCallCount(data.api_calls);
+}
+
+function checkFinished(data) {
+  if (!data.running) cancelBtn.style.display = "none";
+  // Check if generation is complete or stopped
+  if (data.generated >= data.total && data.total > 0) {
+    progressText.innerText = `Done! ${data.generated} rows generated.`;
+    downloadButtons.style.display = "block";
+    return true;
+  } else if (!data.running && data.generated > 0) {
+    // Generation stopped but we have some data
+    progressText.innerText = `Generation stopped. ${data.generated} rows available.`;
+    downloadButtons.style.display = "block";
+    return true;
+  }
+  return false;
+}
+
+function followEvents() {
+  // Server pushes progress, new rows and stream deltas; no polling needed
+  const source = new EventSource("/events");
+  eventSource = source;
+  let streamId = null;
+  let streamText = "";
+  let rowCount = 0;
+  
+  source.addEventListener("rows", (e) => {
+    const data = JSON.parse(e.data);
+    showPreview(data.columns, data.rows);
+    rowCount = data.total;
+    showCsvStatus(rowCount, true);
+  });
+  
+  source.addEventListener("stream", (e) => {
+    const data = JSON.parse(e.data);
+    // Only the newest batch is shown, so older stream text is dropped
+    if (data.id !== streamId) {
+      if (streamId !== null && data.id < streamId) return;
+      streamId = data.id;
+      streamText = "";
+    }
+    streamText += data.delta;
+    showStreamContent([{ status: data.status, text: streamText }]);
+  });
+  
+  source.addEventListener("replaced", () => {
+    // Another job became the server's current one (e.g. from another tab)
+    source.close();
+    cancelBtn.style.display = "none";
+    progressText.innerText = "Another generation was started; this one is no longer shown.";
+  });
+  
+  source.addEventListener("progress", (e) => {
+    const data = JSON.parse(e.data);
+    if (data.error) {
+      source.close();
+      showError(data.error);
+      return;
+    }
+    showProgress(data);
+    showCsvStatus(rowCount, false);
+    if (checkFinished(data) || !data.running) {
+      source.close();
+    }
+  });
+}
 
+async function pollProgress() {
+  const id = followId;
   let finished = false;
   let lastRowCount = 0;
-  while (!finished) {
+  while (!finished && id === followId) {
     let res, data;
     try {
       res = await fetch("/progress");
@@ -54,51 +163,51 @@ form.addEventListener("submit", async function (e) {
       showError("Error fetching progress.");
       break;
     }
+    if (id !== followId) break;
     if (data.error) {
       showError(data.error);
       break;
     }
-    showWarning(data.warning);
-    const percent = data.total
-      ? Math.floor((data.generated / data.total) * 100)
-      : 0;
-    setProgressBar(percent);
-    progressText.innerText = `${data.generated} / ${data.total} rows generated`;
+    showProgress(data);
     
     // Show streaming content if available
     if (data.stream && data.stream.length > 0) {
       showStreamContent(data.stream, data.columns);
     }
     
-    // Always try to show CSV preview if we have data
-    try {
-      const previewRows = await getLiveCsvRows();
-      if (previewRows.length > 1) { // More than just header
-        const newRowCount = previewRows.length - 1; // Exclude header
-        const hasNewRows = newRowCount > lastRowCount;
-        showPreview(data.columns, previewRows, hasNewRows);
-        lastRowCount = newRowCount;
+    // Fetch only the rows added since the last poll
+    if (data.generated !== lastRowCount) {
+      try {
+        const live = await getLiveCsvRows(lastRowCount);
+        const hasNewRows = live.rows.length > 0;
+        if (hasNewRows) {
+          showPreview(live.header, live.rows);
+        }
+        lastRowCount = live.total;
+        showCsvStatus(lastRowCount, hasNewRows);
+      } catch (e) {
+        console.error("Error fetching CSV preview:", e);
       }
-    } catch (e) {
-      console.error("Error fetching CSV preview:", e);
+    } else {
+      showCsvStatus(lastRowCount, false);
     }
-    // Show API call count
-    showApiCallCount(data.api_calls);
     
-    // Check if generation is complete or stopped
-    if (data.generated >= data.total && data.total > 0) {
-      finished = true;
-      progressText.innerText = `Done! ${data.generated} rows generated.`;
-      downloadButtons.style.display = "block";
-    } else if (!data.running && data.generated > 0) {
-      // Generation stopped but we have some data
-      finished = true;
-      progressText.innerText = `Generation stopped. ${data.generated} rows available.`;
-      downloadButtons.style.display = "block";
-    }
+    finished = checkFinished(data);
     
     await new Promise((r) => setTimeout(r, 300));
   }
+}
+
+cancelBtn.addEventListener("click", async function () {
+  // The server keeps merging batches already in flight, then stops the job;
+  // progress updates report what was kept
+  cancelBtn.disabled = true;
+  progressText.innerText = "Cancelling...";
+  try {
+    await fetch("/cancel", { method: "POST" });
+  } catch (err) {
+    cancelBtn.disabled = false;
+  }
 });
 
 downloadCsvBtn.addEventListener("click", function () {
@@ -109,6 +218,10 @@ downloadJsonBtn.addEventListener("click", function () {
   window.location = "/download_json";
 });
 
+downloadJsonlBtn.addEventListener("click", function () {
+  window.location = "/download_jsonl";
+});
+
 function setProgressBar(percent) {
   progressBar.style.width = percent + "%";
 }
@@ -116,6 +229,7 @@ function setProgressBar(percent) {
 function showError(msg) {
   errorMessage.innerText = msg;
   errorMessage.style.display = "block";
+  cancelBtn.style.display = "none";
 }
 
 function showWarning(msg) {
@@ -176,15 +290,26 @@ function parseCSVLine(line) {
   return result;
 }
 
-async function getLiveCsvRows() {
-  // Fetch the full CSV (live) from the backend
+let liveCsvEtag = null;
+
+async function getLiveCsvRows(since) {
+  // Fetch the header plus the rows after index `since` from the backend
+  const unchanged = { header: null, rows: [], total: since };
   try {
-    const res = await fetch("/csv_live");
+    const headers = liveCsvEtag ? { "If-None-Match": liveCsvEtag } : {};
+    const res = await fetch(`/csv_live?since=${since}`, { headers });
+    if (res.status === 304 || !res.ok) return unchanged;
+    liveCsvEtag = res.headers.get("ETag");
     const text = await res.text();
     const lines = text.split(/\r?\n/).filter((line) => line.trim().length > 0);
-    return lines.map((line) => parseCSVLine(line));
+    const parsed = lines.map((line) => parseCSVLine(line));
+    return {
+      header: parsed[0] || null,
+      rows: parsed.slice(1),
+      total: parseInt(res.headers.get("X-Total-Rows") || String(since), 10),
+    };
   } catch {
-    return [];
+    return unchanged;
   }
 }
 
@@ -229,9 +354,10 @@ function showStreamContent(streams, columns) {
     // Get columns from first object
     const dataColumns = Object.keys(data[0]);
     
-    // Status indicator
-    const statusHTML = `<div style="padding: 10px; margin-bottom: 10px; background: ${lastStream.status === 'complete' ? '#e8f5e9' : '#fff3e0'}; border: 1px solid ${lastStream.status === 'complete' ? '#4caf50' : '#ff9800'}; border-radius: 4px; font-weight: bold; color: ${lastStream.status === 'complete' ? '#2e7d32' : '#e65100'};">
-      ${lastStream.status === 'complete' ? '✓ Stream Complete' : '⏳ Streaming...'} - ${data.length} rows
+    // Status indicator (stopped/failed streams are finished too)
+    const streamDone = lastStream.status !== 'generating';
+    const statusHTML = `<div style="padding: 10px; margin-bottom: 10px; background: ${streamDone ? '#e8f5e9' : '#fff3e0'}; border: 1px solid ${streamDone ? '#4caf50' : '#ff9800'}; border-radius: 4px; font-weight: bold; color: ${streamDone ? '#2e7d32' : '#e65100'};">
+      ${streamDone ? '✓ Stream Complete' : '⏳ Streaming...'} - ${data.length} rows
     </div>`;
     
     // Create scrollable table container
@@ -278,7 +404,7 @@ function showStreamContent(streams, columns) {
       });
       
       // Auto-scroll to bottom if user hasn't manually scrolled up
-      if (!userScrolledStream || lastStream.status === 'complete') {
+      if (!userScrolledStream || streamDone) {
         setTimeout(() => {
           container.scrollTop = container.scrollHeight;
         }, 100);
@@ -294,27 +420,22 @@ function showStreamContent(streams, columns) {
   }
 }
 
-function showPreview(columns, rows, hasNewRows = false) {
-  csvPreviewArea.style.display = "block";
-  
-  if (!rows.length) return;
-  
-  const headerRow = rows[0];
-  const expectedColCount = headerRow.length;
-  
-  // Update status indicator
+function showCsvStatus(rowCount, hasNewRows) {
   const csvStatus = document.getElementById('csv-status');
-  if (csvStatus) {
-    const rowCount = rows.length - 1;
+  if (csvStatus && rowCount > 0) {
     csvStatus.innerHTML = `(${rowCount} rows) ${hasNewRows ? '<span style="color: #ff9800;">⚡ Updating...</span>' : ''}`;
   }
+}
+
+function showPreview(headerRow, newRows) {
+  csvPreviewArea.style.display = "block";
   
-  // Check if we need to rebuild the table
-  const existingRows = csvPreview.querySelectorAll('tbody tr').length;
-  const newRowCount = rows.length - 1; // Exclude header
+  if (!headerRow || !newRows.length) return;
   
-  if (existingRows === 0) {
-    // First time - build entire table
+  const expectedColCount = headerRow.length;
+  
+  if (csvPreview.querySelectorAll('thead').length === 0) {
+    // First time - build the table header
     csvPreview.innerHTML = "";
     
     const thead = document.createElement("thead");
@@ -335,11 +456,11 @@ function showPreview(columns, rows, hasNewRows = false) {
   
   const tbody = document.getElementById("csv-tbody");
   
-  // Add only new rows with animation
-  for (let i = existingRows + 1; i < rows.length; i++) {
-    if (rows[i].length !== expectedColCount) {
-      console.warn(`Skipping row ${i} - has ${rows[i].length} columns, expected ${expectedColCount}`);
-      continue;
+  // Append the new rows with animation
+  newRows.forEach((row, i) => {
+    if (row.length !== expectedColCount) {
+      console.warn(`Skipping new row ${i} - has ${row.length} columns, expected ${expectedColCount}`);
+      return;
     }
     
     const tr = document.createElement("tr");
@@ -347,7 +468,7 @@ function showPreview(columns, rows, hasNewRows = false) {
     tr.style.transform = "translateY(-10px)";
     tr.style.transition = "opacity 0.3s ease, transform 0.3s ease";
     
-    rows[i].forEach((cell) => {
+    row.forEach((cell) => {
       const td = document.createElement("td");
       td.innerText = cell.replace(/^["']|["']$/g, '');
       tr.appendChild(td);
@@ -360,7 +481,7 @@ function showPreview(columns, rows, hasNewRows = false) {
       tr.style.opacity = "1";
       tr.style.transform = "translateY(0)";
     }, 10);
-  }
+  });
   
   // Setup scroll tracking for CSV preview
   if (!csvPreviewArea.hasScrollListener) {
@@ -372,11 +493,9 @@ function showPreview(columns, rows, hasNewRows = false) {
   }
   
   // Auto-scroll to bottom if user hasn't manually scrolled up
-  if (hasNewRows && newRowCount > existingRows) {
-    if (!userScrolledCSV) {
-      setTimeout(() => {
-        csvPreviewArea.scrollTop = csvPreviewArea.scrollHeight;
-      }, 100);
-    }
+  if (!userScrolledCSV) {
+    setTimeout(() => {
+      csvPreviewArea.scrollTop = csvPreviewArea.scrollHeight;
+    }, 100);
   }
 }
@@ -0,0 +1,55 @@
+from batching import BatchSizer
+from engine import Batch
+
+
+def finished_batch(size, added, wait=0.0, request_time=1.0, chars_per_row=200, truncated=False):
+    batch = Batch(1, size, "x" * 400)
+    batch.started = 100.0
+    batch.requested = batch.started + wait
+    batch.finished = batch.requested + request_time
+    batch.received = added
+    batch.added = added
+    batch.chars = added * chars_per_row
+    batch.truncated = truncated
+    return batch
+
+
+def test_climbs_while_the_score_improves():
+    sizer = BatchSizer(start_size=50, max_size=1000)
+    size = sizer.next_size()
+    for _ in range(5):
+        sizer.record(finished_batch(size, size, request_time=1.0))
+        bigger = sizer.next_size()
+        assert bigger > size
+        size = bigger
+
+
+def test_rate_limit_waits_do_not_count_against_a_size():
+    sizer = BatchSizer(start_size=50, max_size=1000)
+    sizer.record(finished_batch(50, 50))
+    size = sizer.next_size()
+    # Same request time, but the batch sat out a long 429 cooldown first
+    sizer.record(finished_batch(size, size, wait=60.0))
+    assert sizer.direction == 1
+    assert sizer.next_size() > size
+
+
+def test_truncation_at_the_token_limit_lowers_the_ceiling():
+    sizer = BatchSizer(start_size=200, max_size=1000, max_output_tokens=4000)
+    # 200 rows asked, 70 complete ones fit in the 4000-token response
+    sizer.record(finished_batch(200, 70, chars_per_row=16000 // 70, truncated=True))
+    assert sizer.ceiling == 63
+    assert sizer.next_size() <= 63
+
+
+def test_failed_and_replayed_batches_are_not_scored():
+    sizer = BatchSizer(start_size=50)
+    failed = finished_batch(50, 0)
+    failed.error, failed.chars = RuntimeError("boom"), 0
+    sizer.record(failed)
+    assert sizer.batches == 0
+
+    replayed = finished_batch(50, 50, request_time=0.001)
+    replayed.replayed = True
+    sizer.record(replayed)
+    assert sizer.scores == {} and sizer.next_size() == 50
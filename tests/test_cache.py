@@ -0,0 +1,119 @@
+import os
+import time
+
+import pytest
+
+from cache import CachedProvider, ResponseCache, cache_key
+from providers import Provider
+
+
+class ScriptedProvider(Provider):
+    """Provider numbering its responses, streamed in two chunks"""
+
+    name = "scripted"
+
+    def __init__(self, fail_calls=()):
+        super().__init__("model")
+        self.calls = 0
+        self.fail_calls = set(fail_calls)
+
+    def stream(self, prompt, columns, batch_size):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise RuntimeError("connection reset")
+        text = f'[{{"text": "{prompt} #{self.calls}"}}]'
+        yield text[:5]
+        yield text[5:]
+
+
+def fetch(provider, prompt):
+    """Run one request the way the engine does: replay() first, then stream()"""
+    text = provider.replay(prompt, ["text"], 1)
+    return text if text is not None else "".join(provider.stream(prompt, ["text"], 1))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    yield cache
+    cache.close()
+
+
+def test_cache_roundtrip_and_counters(cache):
+    key = cache_key("m", "prompt", 0, 0)
+    assert cache.get(key) is None
+    cache.put(key, "[1, 2]")
+    assert cache.get(key) == "[1, 2]"
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=300)
+    keys = [cache_key("m", "p", 0, i) for i in range(3)]
+    for key in keys:
+        cache.put(key, os.urandom(100).hex())  # ~130 bytes once compressed
+        time.sleep(0.01)
+    assert cache.total_bytes <= 300
+    assert cache.evicted == 1
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) is not None
+    cache.close()
+
+
+def test_nth_request_for_a_prompt_replays_the_nth_response(cache):
+    first = CachedProvider(ScriptedProvider(), cache)
+    fetched = [fetch(first, "p") for _ in range(2)] + [fetch(first, "q")]
+    assert first.provider.calls == 3
+
+    second = CachedProvider(ScriptedProvider(), cache)
+    assert [fetch(second, "p") for _ in range(2)] + [fetch(second, "q")] == fetched
+    assert second.provider.calls == 0
+    fetch(second, "p")  # A third "p" was never cached
+    assert second.provider.calls == 1
+
+
+def test_seed_separates_responses(cache):
+    fetch(CachedProvider(ScriptedProvider(), cache, seed=1), "p")
+    other = CachedProvider(ScriptedProvider(), cache, seed=2)
+    fetch(other, "p")
+    assert other.provider.calls == 1
+
+
+def test_failed_response_is_not_stored_and_its_index_is_reused(cache):
+    provider = CachedProvider(ScriptedProvider(fail_calls={1}), cache)
+    with pytest.raises(RuntimeError):
+        fetch(provider, "p")
+    assert len(cache) == 0
+    assert provider.indexes["p"] == [1, [0]]  # Index 0 handed back
+    fetch(provider, "p")
+    assert provider.indexes["p"] == [1, []]
+    assert cache.get(cache_key(provider.model, "p", 0, 0)) is not None
+
+
+def test_abandoned_stream_releases_its_index(cache):
+    provider = CachedProvider(ScriptedProvider(), cache)
+    assert provider.replay("p", ["text"], 1) is None
+    chunks = provider.stream("p", ["text"], 1)
+    next(chunks)
+    chunks.close()  # The engine stopped reading after the first chunk
+    assert len(cache) == 0
+    assert provider.indexes["p"] == [1, [0]]
+
+
+def test_response_is_stored_once_its_last_chunk_is_known(cache):
+    provider = CachedProvider(ScriptedProvider(), cache)
+    assert provider.replay("p", ["text"], 1) is None
+    chunks = provider.stream("p", ["text"], 1)
+    next(chunks)
+    next(chunks)  # The last chunk; the consumer may stop here
+    chunks.close()
+    assert len(cache) == 1
+
+
+def test_miss_that_never_reaches_stream_is_released(cache):
+    provider = CachedProvider(ScriptedProvider(), cache)
+    assert provider.replay("p", ["text"], 1) is None
+    # The engine stopped before streaming; the next lookup on this thread
+    # hands index 0 back before claiming one
+    assert provider.replay("p", ["text"], 1) is None
+    assert provider.indexes["p"] == [1, []]
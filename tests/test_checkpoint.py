@@ -0,0 +1,99 @@
+import csv
+import json
+
+import pytest
+
+from dedup import DigestSet
+from gemini_cli import CheckpointWriter, load_checkpoint, read_checkpoint_meta
+
+COLUMNS = ["text", "label"]
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def write_checkpoint(path, rows, **counters):
+    writer = CheckpointWriter(path, COLUMNS)
+    writer.append(rows)
+    writer.close(**counters)
+
+
+def test_roundtrip(tmp_path):
+    path = str(tmp_path / "out.csv")
+    rows = [["a, with comma", "x"], ['b "quoted"\nnewline', "y"]]
+    write_checkpoint(path, rows, api_calls=3)
+
+    seen = DigestSet()
+    count, meta, last_row = load_checkpoint(path, COLUMNS, seen)
+    assert count == 2 and len(seen) == 2
+    assert last_row == rows[-1]
+    assert meta["rows"] == 2 and meta["api_calls"] == 3
+    assert read_checkpoint_meta(path) == meta
+
+
+def test_rows_after_the_last_commit_are_trimmed(tmp_path):
+    path = str(tmp_path / "out.csv")
+    writer = CheckpointWriter(path, COLUMNS)
+    writer.append([["kept", "1"]])
+    writer.commit()
+    writer.append([["uncommitted", "2"]])
+    writer.file.flush()
+    writer.file.write("torn row with no end")  # Crash mid-write
+    writer.file.close()
+
+    count, meta, last_row = load_checkpoint(path, COLUMNS, DigestSet())
+    assert count == 1 and last_row == ["kept", "1"]
+    assert read_rows(path) == [COLUMNS, ["kept", "1"]]
+
+    # Appends continue on a clean row
+    writer = CheckpointWriter(path, COLUMNS, resume_rows=count)
+    writer.append([["next", "3"]])
+    writer.close()
+    assert read_rows(path) == [COLUMNS, ["kept", "1"], ["next", "3"]]
+    assert read_checkpoint_meta(path)["rows"] == 2
+
+
+def test_sidecar_past_the_durable_data_falls_back_to_the_last_line(tmp_path):
+    # Power loss: the sidecar survived but the end of the data did not
+    path = str(tmp_path / "out.csv")
+    write_checkpoint(path, [["1", "2"], ["3", "4"]])
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+
+    count, meta, last_row = load_checkpoint(path, COLUMNS, DigestSet())
+    assert count == 1 and last_row == ["1", "2"]
+
+    writer = CheckpointWriter(path, COLUMNS, resume_rows=count)
+    writer.append([["5", "6"]])
+    writer.close()
+    assert read_rows(path) == [COLUMNS, ["1", "2"], ["5", "6"]]
+
+
+def test_sidecar_offset_inside_a_row_is_ignored(tmp_path):
+    path = str(tmp_path / "out.csv")
+    write_checkpoint(path, [["1", "2"], ["3", "4"]])
+    meta = read_checkpoint_meta(path)
+    with open(path + ".meta", "w", encoding="utf-8") as f:
+        json.dump(dict(meta, offset=meta["offset"] - 2), f)
+
+    count, _, last_row = load_checkpoint(path, COLUMNS, None)
+    assert count == 2 and last_row == ["3", "4"]
+
+
+def test_torn_tail_without_sidecar_is_cut_at_the_last_line(tmp_path):
+    path = str(tmp_path / "out.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("text,label\nfirst,1\nsecond,2\nthi")
+
+    count, meta, last_row = load_checkpoint(path, COLUMNS, None)
+    assert (count, meta, last_row) == (2, {}, ["second", "2"])
+    assert read_rows(path) == [COLUMNS, ["first", "1"], ["second", "2"]]
+
+
+def test_column_mismatch_is_rejected(tmp_path):
+    path = str(tmp_path / "out.csv")
+    write_checkpoint(path, [["a", "b"]])
+    with pytest.raises(ValueError):
+        load_checkpoint(path, ["other", "columns"], None)
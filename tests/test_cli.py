@@ -0,0 +1,36 @@
+from gemini_cli import config_problems
+from providers import create_provider
+
+
+def problems(tmp_path, **overrides):
+    settings = dict(description="Trivia", columns=["Question", "Answer"], total_rows=10, batch_size=5,
+                    output_file=str(tmp_path / "out.csv"), concurrency=1, near_dup=None)
+    settings.update(overrides)
+    return config_problems(**settings)
+
+
+def test_valid_config_has_no_problems(tmp_path):
+    assert problems(tmp_path, topics=["sports", "science"], attributes={"tone": ["formal", "casual"]}) == []
+
+
+def test_topics_must_be_a_list_of_strings(tmp_path):
+    assert len(problems(tmp_path, topics="sports,science")) == 1
+    assert len(problems(tmp_path, topics=["sports", 3])) == 1
+
+
+def test_attributes_must_map_names_to_lists(tmp_path):
+    assert len(problems(tmp_path, attributes=["formal", "casual"])) == 1
+    assert len(problems(tmp_path, attributes={"tone": "formal"})) == 1
+    assert len(problems(tmp_path, attributes={"tone": []})) == 1
+
+
+def test_basic_settings_are_checked(tmp_path):
+    found = problems(tmp_path, description=" ", columns=["a", "a"], total_rows=0,
+                     output_file=str(tmp_path / "missing" / "out.csv"))
+    assert len(found) == 4
+
+
+def test_cli_keeps_its_default_gemini_model(monkeypatch):
+    monkeypatch.delenv("GEMINI_MODEL_NAME", raising=False)
+    monkeypatch.setenv("GEMINI_API_KEY", "key")
+    assert create_provider("gemini").model_name == "gemini-1.5-flash"
@@ -0,0 +1,54 @@
+from dedup import DigestSet, SqliteDigestIndex, row_digest
+
+
+def test_row_digest_cells_cannot_collide_across_boundaries():
+    assert row_digest(["ab", "c"]) != row_digest(["a", "bc"])
+    assert row_digest(["a", ""]) != row_digest(["a"])
+
+
+def test_add_reports_new_rows_only():
+    seen = DigestSet()
+    assert seen.add(["a", "b"])
+    assert not seen.add(["a", "b"])
+    assert seen.add(["a", "c"])
+    assert len(seen) == 2
+
+
+def test_growth_keeps_every_row():
+    seen = DigestSet(capacity=4)
+    start = seen.capacity
+    rows = [[f"row {i}", str(i * 7)] for i in range(5000)]
+    assert all(seen.add(row) for row in rows)
+    assert len(seen) == len(rows)
+    assert seen.capacity > start
+    assert seen.count * 2 <= seen.capacity  # Load factor stays at most 1/2
+    assert not any(seen.add(row) for row in rows)
+    assert seen.add(["row 5000", "0"])
+
+
+def test_sqlite_index_survives_reopen(tmp_path):
+    path = str(tmp_path / "seen.sqlite")
+    index = SqliteDigestIndex(path, expected_rows=1000)
+    assert index.add(["a"]) and index.add(["b"])
+    assert not index.add(["a"])
+    index.close()
+
+    index = SqliteDigestIndex(path, expected_rows=1000)
+    assert len(index) == 2
+    assert not index.add(["b"])
+    assert index.add(["c"])
+    index.close()
+
+
+def test_sqlite_index_keeps_only_committed_digests(tmp_path):
+    path = str(tmp_path / "seen.sqlite")
+    index = SqliteDigestIndex(path, expected_rows=1000)
+    index.add(["saved"])
+    index.commit()
+    index.add(["lost"])
+    index.db.close()  # Crash before the next checkpoint
+
+    index = SqliteDigestIndex(path, expected_rows=1000)
+    assert len(index) == 1
+    assert index.add(["lost"])
+    index.close()
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from cache import CachedProvider, ResponseCache
+from engine import GenerationEngine
+from metrics import Metrics
+from providers import MockProvider, MockRateLimitError
+from ratelimit import RateLimiter
+
+COLUMNS = ["text", "label"]
+
+
+def make_engine(provider, total_rows=50, **kwargs):
+    return GenerationEngine(provider, "test rows", COLUMNS, total_rows, batch_size=10, **kwargs)
+
+
+def test_generates_unique_rows_up_to_the_target():
+    rows = []
+    engine = make_engine(MockProvider(duplicate_rate=0.2), total_rows=95, concurrency=4,
+                         on_rows=rows.extend)
+    assert engine.run() == 95
+    assert len(rows) == 95
+    assert len({tuple(row) for row in rows}) == 95
+    assert engine.stop_reason is None
+
+
+def test_stops_after_too_many_empty_batches():
+    ended = []
+    engine = make_engine(MockProvider(malformed_rate=1.0), max_empty_batches=3,
+                         on_batch_end=ended.append)
+    assert engine.run() == 0
+    assert engine.stop_reason == "Too many empty batches"
+    assert engine.api_calls == 3
+    assert all(batch.received == 0 and batch.parse_errors for batch in ended)
+
+
+def test_drain_timeout_abandons_slow_batches():
+    rows = []
+    engine = make_engine(MockProvider(latency=5.0), concurrency=3, on_rows=rows.extend)
+    timer = threading.Timer(0.2, engine.stop, args=("interrupted",), kwargs={"drain_timeout": 0.3})
+    timer.start()
+    start = time.monotonic()
+    try:
+        generated = engine.run()
+    finally:
+        timer.cancel()
+    assert time.monotonic() - start < 3
+    assert generated == 0 and rows == []
+    assert engine.stop_reason == "interrupted"
+    assert engine.abandoned == 3
+    assert engine.closed
+
+
+class FlakyProvider(MockProvider):
+    """Mock provider whose first `failures` calls are rate limited"""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.attempts = 0
+
+    def stream(self, prompt, columns, batch_size):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise MockRateLimitError("429 Too Many Requests (simulated)")
+        return super().stream(prompt, columns, batch_size)
+
+
+def test_rate_limited_batch_is_retried():
+    retries = []
+    limiter = RateLimiter(base_delay=0.01, max_delay=0.05)
+    provider = FlakyProvider(failures=2)
+    engine = make_engine(provider, total_rows=10, rate_limiter=limiter,
+                         on_retry=lambda batch, delay: retries.append(delay))
+    assert engine.run() == 10
+    assert provider.attempts == 3
+    assert engine.retries == 2 and len(retries) == 2
+    assert engine.api_calls == 1
+    assert limiter.rate_limited == 2
+
+
+def test_rate_limit_retries_give_up_after_max_retries():
+    ended = []
+    limiter = RateLimiter(base_delay=0.01, max_delay=0.02, max_retries=2)
+    engine = make_engine(FlakyProvider(failures=100), total_rows=10, rate_limiter=limiter,
+                         max_empty_batches=1, on_batch_end=ended.append)
+    assert engine.run() == 0
+    assert ended[0].rate_limited and ended[0].retries == 2
+    assert limiter.rate_limited == 3  # Every 429 recorded once, none twice
+    assert engine.stop_reason == "Too many empty batches"
+
+
+def test_replayed_batches_are_not_api_calls(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    first = make_engine(CachedProvider(MockProvider(), cache), total_rows=30)
+    assert first.run() == 30
+    assert (first.api_calls, first.replayed) == (3, 0)
+
+    metrics = Metrics()
+    second = make_engine(CachedProvider(MockProvider(), cache), total_rows=30, metrics=metrics)
+    assert second.run() == 30
+    assert (second.api_calls, second.replayed) == (0, 3)
+    assert metrics.batches.values.get(None, 0) == 0
+    assert metrics.replayed.values[None] == 3
+    assert metrics.api_latency.count == 0 and metrics.first_token.count == 0
+    cache.close()
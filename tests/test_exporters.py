@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+
+import pytest
+
+import exporters
+from exporters import iter_csv, iter_json, iter_jsonl, read_csv_rows, write_chunks
+
+COLUMNS = ["q", "a"]
+ROWS = [["1", "plain"], ["2", 'comma, "quote"'], ["3", "line\nbreak é"]]
+
+
+def test_csv_roundtrip_in_chunks(monkeypatch):
+    monkeypatch.setattr(exporters, "CHUNK_ROWS", 2)
+    chunks = list(iter_csv(COLUMNS, ROWS))
+    assert len(chunks) == 2
+    assert list(csv.reader(io.StringIO("".join(chunks)))) == [COLUMNS] + ROWS
+    assert list(csv.reader(io.StringIO("".join(iter_csv(COLUMNS, ROWS, header=False))))) == ROWS
+
+
+def test_json_skips_rows_with_the_wrong_length():
+    text = "".join(iter_json(COLUMNS, ROWS + [["only one"]]))
+    assert json.loads(text) == [dict(zip(COLUMNS, row)) for row in ROWS]
+    assert json.loads("".join(iter_json(COLUMNS, []))) == []
+
+
+def test_jsonl_has_one_object_per_line():
+    lines = "".join(iter_jsonl(COLUMNS, ROWS + [["a", "b", "c"]])).splitlines()
+    assert [json.loads(line) for line in lines] == [dict(zip(COLUMNS, row)) for row in ROWS]
+
+
+def test_write_chunks_can_rewrite_the_file_it_reads(tmp_path):
+    path = str(tmp_path / "data.csv")
+    write_chunks(path, iter_csv(COLUMNS, ROWS))
+    # Streaming a file into itself must not truncate it while it is read
+    write_chunks(path, iter_csv(COLUMNS, read_csv_rows(path)))
+    assert list(read_csv_rows(path)) == ROWS
+    assert not (tmp_path / "data.csv.tmp").exists()
+
+
+def test_write_chunks_keeps_the_old_file_on_error(tmp_path):
+    path = tmp_path / "data.json"
+    path.write_text("old", encoding="utf-8")
+
+    def failing():
+        yield "partial"
+        raise RuntimeError("export failed")
+
+    with pytest.raises(RuntimeError):
+        write_chunks(str(path), failing())
+    assert path.read_text(encoding="utf-8") == "old"
+    assert not (tmp_path / "data.json.tmp").exists()
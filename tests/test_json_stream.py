@@ -0,0 +1,87 @@
+import json
+
+from json_stream import JsonArrayParser, rows_from_items
+
+ITEMS = [
+    {"text": 'she said "hi" and left', "label": "quote"},
+    {"text": "back\\slash \\\" and } ] { [ inside", "label": "brackets"},
+    {"text": "unicode é \\u00e9 and a tab\t", "label": "escapes"},
+    {"text": "nested", "label": {"a": [1, {"b": "}"}]}},
+]
+
+
+def feed_all(parser, chunks):
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    return items
+
+
+def test_whole_array_in_one_chunk():
+    parser = JsonArrayParser()
+    assert parser.feed(json.dumps(ITEMS)) == ITEMS
+    assert parser.done and not parser.truncated
+    assert parser.objects == len(ITEMS) and parser.errors == 0
+
+
+def test_every_two_chunk_split():
+    # Covers splits right after a backslash and inside every string
+    text = json.dumps(ITEMS)
+    for cut in range(len(text) + 1):
+        parser = JsonArrayParser()
+        assert feed_all(parser, [text[:cut], text[cut:]]) == ITEMS, cut
+        assert parser.done
+
+
+def test_empty_chunk_after_a_backslash_keeps_the_escape():
+    parser = JsonArrayParser()
+    assert feed_all(parser, ['[{"a": "x\\', '', '"y"}]']) == [{"a": 'x"y'}]
+
+
+def test_one_character_chunks():
+    text = json.dumps(ITEMS, indent=2)
+    parser = JsonArrayParser()
+    assert feed_all(parser, text) == ITEMS
+    assert parser.open_chars == 0
+
+
+def test_data_wrapper_and_preamble_are_skipped():
+    text = "Sure! Here you go:\n```json\n" + json.dumps({"data": ITEMS}) + "\n```"
+    for size in (1, 7, len(text)):
+        parser = JsonArrayParser()
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert feed_all(parser, chunks) == ITEMS
+        assert parser.done
+
+
+def test_nothing_after_the_array_is_parsed():
+    parser = JsonArrayParser()
+    assert parser.feed('[{"a": "1"}] and also [{"b": "2"}]') == [{"a": "1"}]
+    assert parser.done
+
+
+def test_truncated_input_keeps_complete_objects():
+    text = json.dumps(ITEMS)
+    cut = text.index('"nested"')
+    parser = JsonArrayParser()
+    assert feed_all(parser, [text[:cut - 5], text[cut - 5:cut]]) == ITEMS[:3]
+    assert parser.truncated
+    assert parser.open_chars > 0
+
+
+def test_no_array_is_not_truncated():
+    parser = JsonArrayParser()
+    assert parser.feed("I cannot help with that.") == []
+    assert not parser.started and not parser.truncated
+
+
+def test_malformed_objects_are_counted_and_skipped():
+    parser = JsonArrayParser()
+    items = parser.feed('[{"a": "1"}, {"a" "2"}, {"a": "3"}]')
+    assert items == [{"a": "1"}, {"a": "3"}]
+    assert parser.errors == 1 and parser.objects == 2
+
+
+def test_rows_from_items():
+    items = [{"a": " x ", "b": 2}, "not an object", {"b": "y"}]
+    assert rows_from_items(items, ["a", "b"]) == [["x", "2"], ["", "y"]]
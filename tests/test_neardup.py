@@ -0,0 +1,53 @@
+from neardup import NearDuplicateFilter, lsh_params, normalize
+
+ROW = ["The storm closed every school in the city on Tuesday morning",
+       "Officials said classes will resume after the roads are cleared"]
+
+
+def test_normalize_drops_case_and_punctuation():
+    assert normalize("Hello, WORLD!  it's") == ["hello", "world", "it", "s"]
+
+
+def test_lsh_params_use_every_permutation():
+    for threshold in (0.5, 0.8, 0.95):
+        bands, rows = lsh_params(32, threshold)
+        assert bands * rows == 32
+
+
+def test_rejects_rows_differing_only_in_case_and_punctuation():
+    near = NearDuplicateFilter(0.8)
+    assert near.admit(ROW)
+    assert not near.admit([cell.upper() + "!" for cell in ROW])
+    assert len(near) == 1
+
+
+def test_admits_unrelated_rows():
+    near = NearDuplicateFilter(0.8)
+    rows = [[f"Question {i} about {topic}", f"An answer mentioning {topic} and number {i * 37}"]
+            for i, topic in enumerate(["rivers", "volcanoes", "jazz", "chess", "bridges", "tea"])]
+    assert all(near.admit(row) for row in rows)
+    assert len(near) == len(rows)
+
+
+def test_add_remembers_without_checking():
+    near = NearDuplicateFilter(0.8)
+    near.add(ROW)
+    near.add(ROW)
+    assert len(near) == 2
+    assert not near.admit(ROW)
+
+
+def test_rows_without_words_are_admitted():
+    near = NearDuplicateFilter(0.8)
+    assert near.admit(["", "..."])
+    assert near.admit(["", "..."])
+    assert len(near) == 0
+
+
+def test_table_growth_keeps_earlier_rows():
+    near = NearDuplicateFilter(0.8)
+    rows = [[f"row number {i} with some distinct words {i * 7919}", f"value {i}"] for i in range(3000)]
+    for row in rows:
+        near.add(row)
+    assert not near.admit(rows[0])
+    assert not near.admit(rows[-1])
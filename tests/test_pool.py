@@ -0,0 +1,51 @@
+import threading
+import time
+
+from pool import FairPool
+
+
+def test_keys_are_served_round_robin():
+    pool = FairPool(1)
+    gate = threading.Event()
+    order = []
+    pool.submit("busy", gate.wait)  # Holds the only worker while requests queue up
+    futures = [pool.submit("a", order.append, f"a{i}") for i in range(3)]
+    futures.append(pool.submit("b", order.append, "b0"))
+    gate.set()
+    for future in futures:
+        future.result(timeout=5)
+    assert order == ["a0", "b0", "a1", "a2"]
+    pool.close()
+
+
+def test_cancel_drops_only_requests_not_started():
+    pool = FairPool(1)
+    gate = threading.Event()
+    running = pool.submit("job", gate.wait)
+    queued = pool.submit("job", lambda: "never")
+    other = pool.submit("other", lambda: "ran")
+    time.sleep(0.05)
+    pool.executor("job").shutdown(cancel_futures=True)
+    gate.set()
+    assert running.result(timeout=5) is True
+    assert queued.cancelled()
+    assert other.result(timeout=5) == "ran"
+    pool.close()
+
+
+def test_exceptions_reach_the_future():
+    pool = FairPool(1)
+    future = pool.executor("job").submit(lambda: 1 / 0)
+    assert isinstance(future.exception(timeout=5), ZeroDivisionError)
+    pool.close()
+
+
+def test_owned_executor_stops_its_workers():
+    pool = FairPool(3)
+    executor = pool.executor(None, owned=True)
+    assert executor.submit(sum, [1, 2]).result(timeout=5) == 3
+    assert all(worker.daemon for worker in pool.workers)
+    executor.shutdown(wait=False)
+    for worker in pool.workers:
+        worker.join(timeout=5)
+        assert not worker.is_alive()
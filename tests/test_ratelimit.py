@@ -0,0 +1,95 @@
+import threading
+import time
+
+from ratelimit import RateLimiter, TokenBucket, pause, rate_limit_info
+
+
+def test_burst_of_429s_halves_concurrency_once():
+    limiter = RateLimiter(max_concurrency=8, base_delay=1.0)
+    for _ in range(8):
+        limiter.on_rate_limited(0)
+    assert limiter.concurrency_limit == 4
+    assert limiter.rate_limited == 8
+
+
+def test_429_after_the_cooldown_halves_again():
+    limiter = RateLimiter(max_concurrency=8, base_delay=0.01, max_delay=0.01)
+    limiter.on_rate_limited(0)
+    time.sleep(0.02)
+    limiter.on_rate_limited(0)
+    assert limiter.concurrency_limit == 2
+
+
+class StatusError(Exception):
+    def __init__(self, message, status_code=None, headers=None):
+        super().__init__(message)
+        self.status_code = status_code
+        if headers is not None:
+            self.response = type("Response", (), {"headers": headers})()
+
+
+def test_rate_limit_info_recognizes_quota_errors():
+    assert rate_limit_info(StatusError("boom", 429)) == (True, None)
+    assert rate_limit_info(StatusError("429 RESOURCE_EXHAUSTED. Please retry in 12.5s")) == (True, 12.5)
+    assert rate_limit_info(StatusError("quota exceeded, retry_delay { seconds: 7 }")) == (True, 7.0)
+    assert rate_limit_info(StatusError("slow down", 429, {"retry-after": "3"})) == (True, 3.0)
+    assert rate_limit_info(StatusError("internal error", 500)) == (False, None)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(600)  # 10 per second
+    assert bucket.acquire(600)
+    start = time.monotonic()
+    assert bucket.acquire(2)
+    assert 0.1 < time.monotonic() - start < 1
+
+
+def test_token_bucket_unlimited_and_refunds():
+    assert TokenBucket(0).acquire(10 ** 9)
+    bucket = TokenBucket(60)
+    assert bucket.acquire(60)
+    bucket.adjust(-30)  # Refund after the fact
+    start = time.monotonic()
+    assert bucket.acquire(30)
+    assert time.monotonic() - start < 0.2
+
+
+def test_stop_event_cuts_waits_short():
+    stop = threading.Event()
+    bucket = TokenBucket(60)
+    bucket.acquire(60)
+    threading.Timer(0.1, stop.set).start()
+    start = time.monotonic()
+    assert not bucket.acquire(30, stop)
+    assert time.monotonic() - start < 1
+    assert pause(5, stop)
+
+
+def test_stopped_acquire_refunds_the_request():
+    limiter = RateLimiter(requests_per_min=60, tokens_per_min=60)
+    limiter.tokens.acquire(60)
+    stop = threading.Event()
+    stop.set()
+    level = limiter.requests.level
+    assert not limiter.acquire(10, stop)
+    assert limiter.requests.level >= level  # The request unit was given back
+
+
+def test_backoff_honours_retry_after_and_max_delay():
+    limiter = RateLimiter(base_delay=1.0, max_delay=4.0)
+    for attempt in range(6):
+        delay = limiter.backoff_delay(attempt)
+        assert min(4.0, 2 ** attempt) / 2 <= delay <= 4.0
+    assert limiter.backoff_delay(0, retry_after=30) == 30
+
+
+def test_concurrency_grows_back_after_clean_windows():
+    limiter = RateLimiter(max_concurrency=4, base_delay=0.01, max_delay=0.01)
+    limiter.on_rate_limited(0)
+    assert limiter.concurrency_limit == 2
+    for _ in range(2):
+        limiter.on_success()
+    assert limiter.concurrency_limit == 3
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.concurrency_limit == 4
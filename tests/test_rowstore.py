@@ -0,0 +1,42 @@
+import pytest
+
+from rowstore import RowStore
+
+
+def test_rows_roundtrip_including_unicode_and_empty_cells():
+    store = RowStore(["a", "b"])
+    rows = [["x", ""], ["é ünïcode 漢字", "emoji 🎉"], ["line\nbreak", "comma, quote\""]]
+    store.extend(rows)
+    assert len(store) == 3
+    assert [store.row(i) for i in range(3)] == rows
+    assert list(store.snapshot()) == rows
+
+
+def test_snapshot_does_not_grow_with_later_appends():
+    store = RowStore(["a"])
+    store.extend([["1"], ["2"]])
+    snapshot = store.snapshot()
+    store.append(["3"])
+    assert len(snapshot) == 2 and list(snapshot) == [["1"], ["2"]]
+    assert len(store.snapshot(10)) == 3
+
+
+def test_snapshot_slicing_and_indexing():
+    store = RowStore(["a"])
+    store.extend([[str(i)] for i in range(10)])
+    view = store.snapshot()[2:8]
+    assert len(view) == 6
+    assert view[0] == ["2"] and view[-1] == ["7"]
+    assert list(view[4:]) == [["6"], ["7"]]
+    assert list(view[5:2]) == []
+    with pytest.raises(IndexError):
+        view[6]
+    with pytest.raises(ValueError):
+        view[::2]
+
+
+def test_nbytes_counts_encoded_text():
+    store = RowStore(["a", "b"])
+    empty = store.nbytes()
+    store.append(["abc", "é"])
+    assert store.nbytes() == empty + 3 + 2 + 2 * 8
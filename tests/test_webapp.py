@@ -0,0 +1,125 @@
+import csv
+import io
+import json
+import time
+
+import pytest
+
+from providers import MockProvider
+from webapp import create_app
+
+COLUMNS = ["Question", "Answer"]
+
+
+@pytest.fixture
+def app():
+    return create_app(MockProvider(), max_batch_size=50, concurrency=2)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def generate(client, app, total_rows=120):
+    response = client.post("/generate", json={"description": "Trivia", "columns": COLUMNS,
+                                              "total_rows": total_rows, "batch_size": 50})
+    assert response.status_code == 200
+    job = app.config["JOB_MANAGER"].get(response.get_json()["id"])
+    assert job.wait(10)
+    return job
+
+
+def test_csv_live_etag_depends_on_since(client, app):
+    generate(client, app)
+    partial = client.get("/csv_live?since=50")
+    assert partial.status_code == 200
+    assert partial.headers["X-Total-Rows"] == "120"
+    assert len(partial.get_data(as_text=True).strip().splitlines()) == 1 + 70
+
+    assert client.get("/csv_live?since=50", headers={"If-None-Match": partial.headers["ETag"]}).status_code == 304
+    full = client.get("/csv_live?since=0", headers={"If-None-Match": partial.headers["ETag"]})
+    assert full.status_code == 200
+    assert len(full.get_data(as_text=True).strip().splitlines()) == 1 + 120
+
+
+def parse_events(text):
+    """(event, id, data) of each Server-Sent Events message"""
+    events = []
+    for message in text.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in message.splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], fields.get("id"), json.loads(fields["data"])))
+    return events
+
+
+def test_job_api_create_list_status_download(client, app):
+    response = client.post("/jobs", json={"description": "Trivia", "columns": COLUMNS, "total_rows": 60})
+    assert response.status_code == 201
+    job_id = response.get_json()["id"]
+    assert app.config["JOB_MANAGER"].get(job_id).wait(10)
+
+    assert job_id in [job["id"] for job in client.get("/jobs").get_json()["jobs"]]
+    status = client.get(f"/jobs/{job_id}").get_json()
+    assert (status["status"], status["generated"], status["total"]) == ("finished", 60, 60)
+    assert status["api_calls"] >= 2
+
+    rows = list(csv.reader(io.StringIO(client.get(f"/jobs/{job_id}/download?format=csv").get_data(as_text=True))))
+    assert rows[0] == COLUMNS and len(rows) == 61
+    items = json.loads(client.get(f"/jobs/{job_id}/download?format=json").get_data(as_text=True))
+    assert len(items) == 60 and set(items[0]) == set(COLUMNS)
+    assert len(client.get(f"/jobs/{job_id}/download?format=jsonl").get_data(as_text=True).splitlines()) == 60
+    assert client.get(f"/jobs/{job_id}/download?format=xml").status_code == 400
+
+
+def test_job_api_errors(client):
+    assert client.get("/jobs/nope").status_code == 404
+    assert client.post("/jobs/nope/cancel").status_code == 404
+    assert client.post("/jobs", json={"description": "Trivia", "columns": COLUMNS}).status_code == 400
+
+
+def test_cancel_keeps_rows_received_so_far():
+    app = create_app(MockProvider(latency=0.2), max_batch_size=10, concurrency=2, drain_timeout=5)
+    client = app.test_client()
+    job_id = client.post("/jobs", json={"description": "Trivia", "columns": COLUMNS, "total_rows": 10000,
+                                        "batch_size": 10}).get_json()["id"]
+    time.sleep(0.5)
+    summary = client.post(f"/jobs/{job_id}/cancel").get_json()
+    assert summary["status"] == "cancelled"
+    assert 0 < summary["generated"] < 10000
+
+
+def test_events_stream_rows_and_progress(client, app):
+    job = generate(client, app, total_rows=120)
+    events = parse_events(client.get("/events").get_data(as_text=True))
+    rows = [data for event, _, data in events if event == "rows"]
+    assert sum(len(data["rows"]) for data in rows) == 120
+    assert [event_id for event, event_id, _ in events if event == "rows"][-1] == f"{job.id}:120"
+    assert events[-1][0] == "progress" and not events[-1][2]["running"]
+
+
+def test_events_resume_from_last_event_id(client, app):
+    job = generate(client, app, total_rows=120)
+    events = parse_events(client.get("/events", headers={"Last-Event-ID": f"{job.id}:100"}).get_data(as_text=True))
+    assert sum(len(data["rows"]) for event, _, data in events if event == "rows") == 20
+
+    # An id from another job counts as nothing sent
+    events = parse_events(client.get("/events", headers={"Last-Event-ID": "other:100"}).get_data(as_text=True))
+    assert sum(len(data["rows"]) for event, _, data in events if event == "rows") == 120
+
+
+def test_events_tell_the_client_when_the_job_is_replaced():
+    app = create_app(MockProvider(latency=0.3), max_batch_size=10, drain_timeout=1)
+    client = app.test_client()
+    first = client.post("/generate", json={"description": "Trivia", "columns": COLUMNS,
+                                           "total_rows": 10000, "batch_size": 10}).get_json()["id"]
+    response = client.get("/events", buffered=False)
+    messages = (chunk.decode("utf-8") for chunk in response.response)
+    assert "event: progress" in next(messages)  # Stream is open on the first job
+
+    second = client.post("/generate", json={"description": "Other", "columns": COLUMNS,
+                                            "total_rows": 10, "batch_size": 10}).get_json()["id"]
+    replaced = [message for message in messages if "event: replaced" in message]
+    response.close()
+    assert parse_events(replaced[0])[0][2] == {"id": first, "current": second}
+    client.post(f"/jobs/{first}/cancel")
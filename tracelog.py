@@ -0,0 +1,272 @@
+"""
+Per-batch trace log and offline run report.
+
+TraceWriter writes a JSON Lines file: a "run" record with the settings, one
+"batch" record per finished batch (request size, estimated tokens, latency
+breakdown, row counts, checkpoint time) and an "end" record. Runs resumed
+with the same trace file are appended as new runs.
+
+report() reads one or more traces and prints, per run, the tail latencies
+of every stage, throughput and yield over time, and yield by dataset size,
+followed by a comparison when several runs are given:
+
+    python3 gemini_cli.py report run.jsonl other.jsonl
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+
+from engine import CHARS_PER_TOKEN, STAGES
+
+# Latency breakdown keys in report order
+LATENCY_KEYS = ("total", "queue", "first_token", "stream") + STAGES + ("checkpoint",)
+
+
+def _seconds(value):
+    return None if value is None else round(value, 6)
+
+
+def _between(start, end):
+    return None if start is None or end is None else end - start
+
+
+def batch_record(batch, start, generated, checkpoint=0.0):
+    """Trace record of a finished engine.Batch (`start`: run start time)"""
+    latency = {
+        "total": _between(batch.started, batch.finished),
+        "queue": _between(batch.started, batch.requested),     # Rate limiting and retries
+        "first_token": _between(batch.requested, batch.first_chunk),
+        "stream": _between(batch.first_chunk, batch.finished),
+    }
+    latency.update(batch.times)
+    latency["checkpoint"] = checkpoint
+    rejected = sum(batch.rejected.values())
+    return {
+        "type": "batch",
+        "batch": batch.number,
+        "t": round(batch.finished - start, 3),
+        "size": batch.size,
+        "variant": batch.variant,
+        "prompt_tokens": round(len(batch.prompt) / CHARS_PER_TOKEN),
+        "response_tokens": round(batch.chars / CHARS_PER_TOKEN),
+        "chars": batch.chars,
+        "retries": batch.retries,
+        "replayed": batch.replayed,
+        "error": str(batch.error) if batch.error else None,
+        "rate_limited": batch.rate_limited,
+        "truncated": batch.truncated,
+        "aborted": batch.aborted,
+        "stopped": batch.stopped,
+        "latency": {key: _seconds(value) for key, value in latency.items()},
+        "rows": {
+            "parsed": batch.received + batch.invalid,
+            "malformed": batch.parse_errors,
+            "valid": batch.received,
+            "unique": batch.received - batch.duplicates - rejected,
+            "accepted": batch.added,
+            "duplicates": batch.duplicates,
+            "invalid": batch.invalid,
+            "rejected": batch.rejected,
+        },
+        "generated": generated,
+    }
+
+
+class TraceWriter:
+    """Append trace records to a JSON Lines file, flushed after each one"""
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.start = time.time()
+        if append and os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                complete = f.read(1) == b"\n"
+        else:
+            complete = True
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        if not complete:
+            self.file.write("\n")  # An earlier run died mid-record
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def run(self, **settings):
+        self.write(dict({"type": "run", "time": self.start}, **settings))
+
+    def batch(self, batch, generated, checkpoint=0.0):
+        self.write(batch_record(batch, self.start, generated, checkpoint))
+
+    def end(self, **totals):
+        self.write(dict({"type": "end", "t": round(time.time() - self.start, 3)}, **totals))
+
+    def close(self):
+        self.file.close()
+
+
+def load_runs(paths):
+    """Runs in the trace files as dicts with label, settings, batches and end"""
+    runs = []
+    for path in paths:
+        file_runs = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Last line of a trace that is still being written
+                if record.get("type") == "run" or not file_runs:
+                    file_runs.append({"settings": record if record.get("type") == "run" else {},
+                                      "batches": [], "end": None})
+                if record.get("type") == "batch":
+                    file_runs[-1]["batches"].append(record)
+                elif record.get("type") == "end":
+                    file_runs[-1]["end"] = record
+        name = os.path.basename(path)
+        for i, run in enumerate(file_runs):
+            run["label"] = name if len(file_runs) == 1 else f"{name}#{i + 1}"
+        runs.extend(file_runs)
+    return runs
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(round(q / 100 * len(values), 9)) - 1)]
+
+
+def _ratio(part, whole):
+    return part / whole if whole else 0.0
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds:.3f}"
+
+
+def _duration(run):
+    batches = run["batches"]
+    end = run["end"]["t"] if run["end"] else 0
+    return max(end, batches[-1]["t"] if batches else 0)
+
+
+def summarize(run):
+    """Totals of one run used by the report and the comparison"""
+    batches = run["batches"]
+    accepted = sum(b["rows"]["accepted"] for b in batches)
+    requested = sum(b["size"] for b in batches)
+    valid = sum(b["rows"]["valid"] for b in batches)
+    duration = _duration(run)
+    totals = sorted(b["latency"]["total"] for b in batches if b["latency"]["total"] is not None)
+    return {
+        "batches": len(batches),
+        "accepted": accepted,
+        "duration": duration,
+        "rate": _ratio(accepted, duration),
+        "yield": _ratio(accepted, requested),
+        "duplicates": _ratio(sum(b["rows"]["duplicates"] for b in batches), valid),
+        "tokens_per_row": _ratio(sum(b["response_tokens"] for b in batches), accepted),
+        "p50": percentile(totals, 50),
+        "p99": percentile(totals, 99),
+    }
+
+
+def _span(i, width):
+    """Label of the i-th range of `width`, with enough decimals to tell ranges apart"""
+    digits = 0 if width >= 5 else 1 if width >= 0.5 else 3
+    return f"{i * width:.{digits}f}-{(i + 1) * width:.{digits}f}"
+
+
+def _windows(batches, count, key, limit):
+    """Split batches into `count` equal ranges of key(batch) over [0, limit]"""
+    width = max(limit / count, 1e-9)
+    windows = [[] for _ in range(count)]
+    for b in batches:
+        windows[min(count - 1, int(key(b) / width))].append(b)
+    return width, windows
+
+
+def report_run(run, buckets=10, out=print):
+    settings = run["settings"]
+    batches = run["batches"]
+    total = summarize(run)
+    details = ", ".join(f"{name} {settings[key]}" for key, name in (
+        ("provider", "provider"), ("model", "model"), ("total_rows", "target"),
+        ("batch_size", "batch"), ("concurrency", "concurrency")) if settings.get(key) is not None)
+    out(f"\n== {run['label']}" + (f" ({details})" if details else "") + " ==")
+    if not batches:
+        out("  no batches recorded")
+        return
+    out(f"  {total['batches']} batches, {total['accepted']} rows accepted in {total['duration']:.1f}s "
+        f"= {total['rate']:.1f} rows/sec")
+    out(f"  yield {total['yield']:.0%} of requested rows, duplicates {total['duplicates']:.0%} of valid rows, "
+        f"~{total['tokens_per_row']:.0f} response tokens per accepted row")
+    out(f"  errors {sum(1 for b in batches if b['error'])}, retries {sum(b['retries'] for b in batches)}, "
+        f"truncated {sum(1 for b in batches if b['truncated'])}, "
+        f"abandoned early {sum(1 for b in batches if b['aborted'])}, "
+        f"replayed from cache {sum(1 for b in batches if b.get('replayed'))}")
+    end = run["end"]
+    if end and end.get("stop_reason"):
+        out(f"  stopped: {end['stop_reason']}")
+
+    out(f"\n  {'latency (s)':<14}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'total':>10}")
+    for key in LATENCY_KEYS:
+        values = sorted(b["latency"][key] for b in batches if b["latency"].get(key) is not None)
+        if not values:
+            continue
+        out(f"  {key:<14}" + "".join(f"{_fmt(percentile(values, q)):>9}" for q in (50, 90, 99))
+            + f"{_fmt(values[-1]):>9}{sum(values):>10.2f}")
+
+    width, windows = _windows(batches, buckets, lambda b: b["t"], total["duration"])
+    peak = max(sum(b["rows"]["accepted"] for b in window) for window in windows) or 1
+    out(f"\n  {'time (s)':<16}{'rows/sec':>10}{'yield':>8}{'dups':>7}{'p90 lat':>9}")
+    for i, window in enumerate(windows):
+        accepted = sum(b["rows"]["accepted"] for b in window)
+        latencies = sorted(b["latency"]["total"] for b in window if b["latency"]["total"] is not None)
+        out(f"  {_span(i, width):<16}{accepted / width:>10.1f}"
+            f"{_ratio(accepted, sum(b['size'] for b in window)):>8.0%}"
+            f"{_ratio(sum(b['rows']['duplicates'] for b in window), sum(b['rows']['valid'] for b in window)):>7.0%}"
+            f"{_fmt(percentile(latencies, 90)):>9}  " + "#" * round(20 * accepted / peak))
+
+    # Yield curve: how yield and duplicates change as the dataset grows
+    target = settings.get("total_rows") or max(b["generated"] for b in batches)
+    width, windows = _windows(batches, buckets, lambda b: b["generated"] - b["rows"]["accepted"], target)
+    out(f"\n  {'dataset rows':<16}{'batches':>8}{'yield':>8}{'dups':>7}")
+    for i, window in enumerate(windows):
+        if not window:
+            continue
+        out(f"  {_span(i, width):<16}{len(window):>8}"
+            f"{_ratio(sum(b['rows']['accepted'] for b in window), sum(b['size'] for b in window)):>8.0%}"
+            f"{_ratio(sum(b['rows']['duplicates'] for b in window), sum(b['rows']['valid'] for b in window)):>7.0%}")
+
+
+def report(paths, buckets=10, out=print):
+    """Print a report of every run in the trace files at `paths`"""
+    runs = load_runs(paths)
+    for run in runs:
+        report_run(run, buckets, out)
+    if len(runs) > 1:
+        out(f"\n== comparison ==\n  {'run':<24}{'rows/sec':>10}{'yield':>8}{'dups':>7}{'p50 lat':>9}{'p99 lat':>9}")
+        for run in runs:
+            total = summarize(run)
+            out(f"  {run['label']:<24}{total['rate']:>10.1f}{total['yield']:>8.0%}{total['duplicates']:>7.0%}"
+                f"{_fmt(total['p50']):>9}{_fmt(total['p99']):>9}")
+    return runs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="gemini_cli.py report",
+                                     description="Summarize trace files written with --trace")
+    parser.add_argument("traces", nargs="+", help="Trace files (JSON Lines)")
+    parser.add_argument("--buckets", type=int, default=10,
+                        help="Rows in the throughput and yield tables (default: 10)")
+    args = parser.parse_args(argv)
+    report(args.traces, max(1, args.buckets))
+
+
+if __name__ == "__main__":
+    main()
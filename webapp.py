@@ -0,0 +1,278 @@
+"""
+Flask web frontend shared by app.py (OpenAI-compatible) and gemini.py.
+
+create_app() builds the app around one provider. Jobs are run by a
+jobs.JobManager: /jobs creates, lists, cancels and downloads them by id,
+while /generate, /cancel, /progress, /events, /csv_live and /download* drive
+the page's current job, and /metrics serves the server's metrics.Metrics.
+Request handlers never take a generator's lock: they read the immutable
+Snapshot the job last published.
+"""
+
+import json
+
+from flask import Flask, request, jsonify, Response, stream_with_context
+
+from exporters import iter_csv, iter_json, iter_jsonl
+from jobs import JobManager, stream_deltas, stream_latest
+from metrics import Metrics
+
+# Download format -> (exporter, mimetype, file extension)
+DOWNLOAD_FORMATS = {
+    "csv": (iter_csv, "text/csv", "csv"),
+    "json": (iter_json, "application/json", "json"),
+    "jsonl": (iter_jsonl, "application/x-ndjson", "jsonl"),
+}
+
+
+def parse_event_id(event_id, job_id):
+    """Rows already sent, from a Last-Event-ID of the form "<job id>:<rows>".
+
+    Ids of another job (or malformed ones) count as nothing sent, so a
+    reconnect after the current job changed starts the new job from row 0.
+    """
+    job, _, rows = (event_id or "").partition(":")
+    if job != job_id or not rows.isdigit():
+        return None
+    return int(rows)
+
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events message"""
+    message = f"event: {event}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def stream_download(chunks, mimetype, filename):
+    """Send a generated file as a streaming attachment"""
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def download_job(job, fmt, name="dataset"):
+    """Stream a snapshot of `job`'s rows in format `fmt`"""
+    exporter, mimetype, extension = DOWNLOAD_FORMATS[fmt]
+    columns, rows = job.snapshot_rows()
+    return stream_download(exporter(columns, rows), mimetype, f"{name}.{extension}")
+
+
+def parse_job_request(data):
+    """Return (description, columns, total_rows, batch_size) from a request body"""
+    return (
+        data.get("description"),
+        data.get("columns"),
+        int(data.get("total_rows")),
+        int(data.get("batch_size", 50)),
+    )
+
+
+def create_app(provider, max_batch_size=100, concurrency=1, rate_limiter=None, adaptive_batch=True,
+               near_dup_threshold=None, max_jobs=4, drain_timeout=30, prompt_diversity=False):
+    """Create the Flask app generating datasets with `provider`.
+
+    One rate limiter is shared by every job, so concurrent and back-to-back
+    jobs together stay within the quota. Up to `max_jobs` jobs generate at
+    once with `concurrency` batches in flight each. With `adaptive_batch`
+    each job tunes its batch size between the requested one and
+    `max_batch_size`. With `near_dup_threshold`, rows at least that similar
+    to an earlier row of the job are rejected as well. A cancelled job gets
+    `drain_timeout` seconds to merge the batches it already has in flight.
+    With `prompt_diversity`, each batch gets a prompt variant (prompts.py).
+    """
+    app = Flask(__name__, static_folder='static', static_url_path='/static')
+    metrics = Metrics()
+    manager = JobManager(provider, max_batch_size=max_batch_size, concurrency=concurrency,
+                         rate_limiter=rate_limiter, adaptive_batch=adaptive_batch,
+                         near_dup_threshold=near_dup_threshold, max_running=max_jobs,
+                         drain_timeout=drain_timeout, prompt_diversity=prompt_diversity, metrics=metrics)
+    metrics.gauge("jobs_running", "Jobs generating now", lambda: manager.running)
+    metrics.gauge("jobs_queued", "Jobs waiting for a running slot", lambda: len(manager.pending))
+    metrics.gauge("concurrency_limit", "Batches in flight allowed per job after rate limits",
+                  lambda: manager.rate_limiter.concurrency_limit)
+    app.config["JOB_MANAGER"] = manager
+
+    def config_error():
+        """Error response if the provider cannot work (e.g. no API key), else None"""
+        error = provider.config_error()
+        if error:
+            return jsonify({"status": "error", "message": error}), 503
+        return None
+
+    @app.route("/jobs", methods=["POST"])
+    def create_job():
+        error = config_error()
+        if error:
+            return error
+        try:
+            job = manager.create(*parse_job_request(request.json))
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"Invalid request data: {e}"}), 400
+        return jsonify(job.summary()), 201
+
+    @app.route("/jobs", methods=["GET"])
+    def list_jobs():
+        return jsonify({"jobs": [job.summary() for job in manager.list()]})
+
+    @app.route("/jobs/<job_id>", methods=["GET"])
+    def job_status(job_id):
+        job = manager.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "Unknown job"}), 404
+        return jsonify(job.summary())
+
+    def cancel_and_drain(job_id):
+        """Cancel a job and report what it saved once its in-flight batches
+        are merged (or the drain timed out)"""
+        job = manager.cancel(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "Unknown job"}), 404
+        job.wait(manager.drain_timeout + 5)
+        return jsonify(job.summary())
+
+    @app.route("/jobs/<job_id>/cancel", methods=["POST"])
+    def cancel_job(job_id):
+        return cancel_and_drain(job_id)
+
+    @app.route("/jobs/<job_id>/download", methods=["GET"])
+    def download_job_rows(job_id):
+        job = manager.get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": "Unknown job"}), 404
+        fmt = request.args.get("format", "csv")
+        if fmt not in DOWNLOAD_FORMATS:
+            return jsonify({"status": "error", "message": f"Unknown format: {fmt}"}), 400
+        return download_job(job, fmt, f"dataset_{job.id}")
+
+    @app.route("/generate", methods=["POST"])
+    def generate_dataset():
+        """Start a job and make it the page's current job"""
+        error = config_error()
+        if error:
+            return error
+        try:
+            job = manager.create(*parse_job_request(request.json))
+        except Exception as e:
+            return jsonify({"status": "error", "message": f"Invalid request data: {e}"}), 400
+        previous = manager.current
+        manager.current = job
+        # Let /events streams of the previous job notice they were replaced
+        with previous.changed:
+            previous.changed.notify_all()
+        return jsonify({"status": "started", "id": job.id})
+
+    @app.route("/cancel", methods=["POST"])
+    def cancel_current():
+        """Cancel the page's current job"""
+        return cancel_and_drain(manager.current.id)
+
+    @app.route("/progress", methods=["GET"])
+    def get_progress():
+        snapshot = manager.current.current
+        return jsonify(dict(snapshot.progress, stream=stream_latest(snapshot.streams)))
+
+    @app.route("/events", methods=["GET"])
+    def events():
+        """Push progress, new rows and stream deltas as Server-Sent Events.
+
+        The stream waits on the job's `changed` condition instead of polling,
+        so an idle client costs nothing. Rows events carry the row count as
+        their id, so a reconnecting EventSource resumes from Last-Event-ID
+        without duplicates; the id includes the job id, so a stale id from a
+        replaced job is ignored. The stream ends once generation has stopped;
+        when another job becomes the current one it sends a "replaced" event
+        first, so the client closes instead of reconnecting.
+        """
+        job = manager.current
+        since = parse_event_id(request.headers.get("Last-Event-ID"), job.id)
+        if since is None:
+            since = request.args.get("since", default=0, type=int)
+
+        def stream():
+            sent_rows = max(since, 0)
+            last_progress = None
+            sent_streams = {}  # stream id -> (chunks pushed, status pushed)
+            seen_version = -1
+            while True:
+                with job.changed:
+                    changed = job.changed.wait_for(
+                        lambda: job.current.version != seen_version or manager.current is not job, timeout=15)
+                if manager.current is not job:
+                    # A new job replaced this one; the client must not reconnect to it
+                    yield sse_event("replaced", {"id": job.id, "current": manager.current.id})
+                    return
+                snapshot = job.current
+                seen_version = snapshot.version
+                progress = snapshot.progress
+                rows = snapshot.rows
+                count = len(rows)
+                streams = stream_deltas(snapshot.streams, sent_streams)
+                if not changed:
+                    yield ": keep-alive\n\n"
+                    continue
+                for stream_id, status, delta in streams:
+                    yield sse_event("stream", {"id": stream_id, "status": status, "delta": delta})
+                if count > sent_rows:
+                    new_rows = list(rows[sent_rows:count])
+                    yield sse_event("rows", {"columns": progress["columns"], "rows": new_rows, "total": count},
+                                    f"{job.id}:{count}")
+                    sent_rows = count
+                if progress != last_progress:
+                    yield sse_event("progress", progress)
+                    last_progress = progress
+                if not progress["running"]:
+                    return
+
+        return Response(
+            stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.route("/download", methods=["GET"])
+    def download_csv():
+        return download_job(manager.current, "csv")
+
+    @app.route("/download_json", methods=["GET"])
+    def download_json():
+        return download_job(manager.current, "json")
+
+    @app.route("/download_jsonl", methods=["GET"])
+    def download_jsonl():
+        return download_job(manager.current, "jsonl")
+
+    @app.route("/csv_live", methods=["GET"])
+    def csv_live():
+        """Show the CSV live (for frontend preview).
+
+        With ?since=N only the header and the rows after index N are returned.
+        X-Total-Rows carries the row count to use as the next `since`, and the
+        ETag (job, since and row count, which together fix the body) lets polls
+        with no new rows be answered with 304 Not Modified.
+        """
+        since = max(request.args.get("since", default=0, type=int), 0)
+        snapshot = manager.current.current
+        columns = snapshot.columns
+        rows = snapshot.rows
+        count = len(rows)
+        etag = f"{snapshot.job_number}-{since}-{count}"
+        headers = {"ETag": f'"{etag}"', "X-Total-Rows": str(count), "Cache-Control": "no-cache"}
+        if request.if_none_match.contains(etag):
+            return "", 304, headers
+        headers["Content-Type"] = "text/csv"
+        return "".join(iter_csv(columns, rows[since:count])), 200, headers
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        """Counters and latency histograms of every job, for Prometheus"""
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route("/")
+    def index():
+        return app.send_static_file("index.html")
+
+    return app